@@ -2,21 +2,28 @@
 import os
 import time
 from typing import Optional, List
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.responses import FileResponse
 from pydantic import BaseModel
 import pandas as pd
 import joblib
-import numpy as np
-import torch
 
 # Import your local modules (make sure PYTHONPATH includes project root or run from project root)
 from feature_engineering import engineer_features_bulk
-# DistilBERT inference (your existing file)
-import inference as severity_inference  # expects function predict_text(text) in inference.py
+# DistilBERT inference (your existing file), optionally behind the linear cascade (SEVERITY_CASCADE=1)
+import cascade as severity_inference  # same predict_text(text) as inference.py
+from severity_cache import severity_cache
 # Duplicate detector (your existing file)
 from duplicate_detection import DuplicateDetector
+from duplicate_index import WINDOW_SECONDS
+from incident_clustering import IncidentClusterer
+from wire import NegotiatedResponse, NegotiatedRoute, ndjson_response
+import profiling
+from profiling import profiled
 
-app = FastAPI(title="Civic AI Models API")
+# JSON (orjson when installed) or MessagePack, per Content-Type / Accept
+app = FastAPI(title="Civic AI Models API", default_response_class=NegotiatedResponse)
+app.router.route_class = NegotiatedRoute
 
 # -------------------------
 # Config / model locations
@@ -24,6 +31,14 @@ app = FastAPI(title="Civic AI Models API")
 PRIORITY_MODEL_PATH = os.getenv("PRIORITY_MODEL_PATH", "models/priority_model.pkl")
 PRIORITY_COLUMNS_PATH = os.getenv("PRIORITY_COLUMNS_PATH", "models/priority_model_columns.pkl")
 
+# Admin endpoints (profiling) take the same X-API-Key as ml_api.py; unchecked when ML_API_KEY is unset (local dev)
+API_KEY = os.getenv("ML_API_KEY")
+API_KEY_NAME = "X-API-Key"
+
+def require_api_key(request: Request):
+    if API_KEY is not None and request.headers.get(API_KEY_NAME) != API_KEY:
+        raise HTTPException(status_code=403, detail="Invalid API key")
+
 # Department mapping (same as your earlier map)
 CATEGORY_TO_DEPARTMENT = {
     "garbage": "Sanitation Dept",
@@ -72,17 +87,26 @@ SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 # Optional: function to fetch issues from Supabase (if env set)
 def fetch_issues_from_supabase(limit=2000):
     if not SUPABASE_URL or not SUPABASE_KEY:
-        return pd.DataFrame([], columns=["id","lat","lon","text"])
+        return pd.DataFrame([], columns=["id","lat","lon","text","category","status","created_at"])
     try:
         from supabase import create_client
         supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
         # adjust table/column names to your schema
-        data = supabase.table("reports").select("id,lat,lon,text").limit(limit).execute()
+        # only open reports inside the duplicate window are indexed
+        since = pd.Timestamp.utcnow() - pd.Timedelta(seconds=WINDOW_SECONDS)
+        data = (
+            supabase.table("reports")
+            .select("id,lat,lon,text,category,status,created_at")
+            .neq("status", "resolved")
+            .gte("created_at", since.isoformat())
+            .limit(limit)
+            .execute()
+        )
         rows = data.data
         return pd.DataFrame(rows)
     except Exception as e:
         print("Supabase fetch error:", e)
-        return pd.DataFrame([], columns=["id","lat","lon","text"])
+        return pd.DataFrame([], columns=["id","lat","lon","text","category","status","created_at"])
 
 # Initialize DuplicateDetector (lazy)
 _DUPLICATE_DETECTOR = None
@@ -91,13 +115,54 @@ _DETECTOR_TTL = int(os.getenv("DETECTOR_TTL_SECONDS", "60"))  # reload every 60s
 
 def get_duplicate_detector(force_reload: bool = False):
     global _DUPLICATE_DETECTOR, _DETECTOR_LOADED_AT
+    if _DUPLICATE_DETECTOR is None and not force_reload:
+        # Warm start: serve from the last snapshot right away, the TTL below triggers a resync once it is stale
+        snapshot_detector = DuplicateDetector.from_snapshot()
+        if snapshot_detector is not None:
+            _DUPLICATE_DETECTOR = snapshot_detector
+            _DETECTOR_LOADED_AT = snapshot_detector.index.created_at
+            print(f"Loaded duplicate index snapshot ({len(snapshot_detector.index)} reports).")
     if _DUPLICATE_DETECTOR is None or force_reload or (time.time() - _DETECTOR_LOADED_AT) > _DETECTOR_TTL:
         df_issues = fetch_issues_from_supabase()
         # If no issues, pass empty df. DuplicateDetector should handle that.
-        _DUPLICATE_DETECTOR = DuplicateDetector(df_issues)
+        previous = _DUPLICATE_DETECTOR.index if _DUPLICATE_DETECTOR is not None else None
+        _DUPLICATE_DETECTOR = DuplicateDetector(df_issues, previous_index=previous)
         _DETECTOR_LOADED_AT = time.time()
+        assign_incidents(df_issues)
+        try:
+            _DUPLICATE_DETECTOR.save_snapshot()
+        except OSError as e:
+            print("Warning: could not write duplicate index snapshot:", e)
     return _DUPLICATE_DETECTOR
 
+# -------------------------
+# Incident clusters (maintain report_count incrementally)
+# -------------------------
+_INCIDENTS = IncidentClusterer()
+
+def assign_incidents(df_issues):
+    """Feed synced reports the clusterer has not seen yet, oldest first."""
+    if df_issues.empty:
+        return
+    df = df_issues.dropna(subset=["lat", "lon"])
+    created = pd.to_datetime(df["created_at"], utc=True, errors="coerce") if "created_at" in df else pd.Series(pd.NaT, index=df.index)
+    ts = (created - pd.Timestamp(0, tz="UTC")).dt.total_seconds()
+    # reports of already closed incidents are still open in Supabase; re-feeding them would reopen the incident
+    newest = ts.max()
+    cutoff = _INCIDENTS.closed_before(None if pd.isna(newest) else float(newest))
+    ts = ts[ts.isna() | (ts >= cutoff)]
+    for idx in ts.sort_values(na_position="last").index:
+        row = df.loc[idx]
+        _INCIDENTS.assign(
+            row["id"], float(row["lat"]), float(row["lon"]), row.get("category"),
+            None if pd.isna(ts[idx]) else float(ts[idx]),
+        )
+
+def predict_severity_cached(text):
+    # retried submissions hit the cache instead of another DistilBERT forward pass
+    result, _ = severity_cache.get_or_compute(text, severity_inference.model_version(), severity_inference.predict_versioned)
+    return result
+
 # -------------------------
 # Request / Response schemas
 # -------------------------
@@ -113,9 +178,22 @@ class ReportIn(BaseModel):
 class DuplicateOut(BaseModel):
     is_duplicate: bool
     duplicate_of: Optional[int] = None
-    similarity: Optional[float] = None
+    method: Optional[str] = None  # "lexical" (SimHash near-verbatim) or "embedding"
+    similarity: Optional[float] = None  # cosine, embedding matches only
+    lexical_similarity: Optional[float] = None  # 1 - differing SimHash bits / 64, lexical matches only
     distance_m: Optional[float] = None
 
+class ResolvedIn(BaseModel):
+    ids: List[int]
+
+class IncidentOut(BaseModel):
+    cluster_id: int
+    report_count: int
+    centroid_lat: float
+    centroid_lon: float
+    first_seen: str
+    last_seen: str
+
 class SeverityOut(BaseModel):
     severity: str
     severity_probs: dict
@@ -133,11 +211,35 @@ class RouteOut(BaseModel):
 # -------------------------
 # Endpoints
 # -------------------------
+# Opt-in profiling: "X-Profile: 1" or the sampling rate from /admin/profiling
+app.add_middleware(profiling.ProfilingMiddleware)
+
+@app.post("/admin/profiling", dependencies=[Depends(require_api_key)])
+def set_profiling(sample_rate: float):
+    """Profile this fraction of requests (0 disables sampling; X-Profile: 1 always works)."""
+    return {"sample_rate": profiling.set_sample_rate(sample_rate)}
+
+@app.get("/profiles", dependencies=[Depends(require_api_key)])
+def profiles():
+    return {"sample_rate": profiling.sample_rate(), "profiles": profiling.list_profiles()}
+
+@app.get("/profiles/{profile_id}/{filename}", dependencies=[Depends(require_api_key)])
+def download_profile(profile_id: str, filename: str):
+    path = profiling.profile_path(profile_id, filename)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, filename=f"{profile_id}-{filename}")
+
 @app.get("/health")
 def health():
-    return {"status": "ok", "priority_model_loaded": PRIORITY_MODEL is not None}
+    return {
+        "status": "ok",
+        "priority_model_loaded": PRIORITY_MODEL is not None,
+        "severity_cache": severity_cache.metrics(),
+    }
 
 @app.post("/detect_duplicate", response_model=DuplicateOut)
+@profiled
 def detect_duplicate(report: ReportIn, reload_issues: Optional[bool] = False):
     """
     Checks spatial + text similarity against existing issues.
@@ -146,49 +248,63 @@ def detect_duplicate(report: ReportIn, reload_issues: Optional[bool] = False):
     reload_issues = reload_issues if reload_issues is not None else False
     
     det = get_duplicate_detector(force_reload=reload_issues)
-    new = {"lat": report.lat, "lon": report.lon, "text": report.text}
-    is_dup, dup_of = det.check_duplicate(new_report=new)
-    # duplicate_detection.check_duplicate can be extended to return similarity/distance; here we'll re-run to compute those
-    # Recompute details:
-    df = det.df.copy()
-    if df.empty:
+    new = {"lat": report.lat, "lon": report.lon, "text": report.text, "category": report.category}
+    match = det.find_best_match(new, distance_threshold=30)
+    if match is None:
         return {"is_duplicate": False, "duplicate_of": None, "similarity": None, "distance_m": None}
 
-    # compute distances and similarities as done in class
-    from duplicate_detection import haversine  # if exported
-    df["distance_m"] = df.apply(lambda r: haversine(report.lat, report.lon, r["lat"], r["lon"]), axis=1)
-    nearby = df[df["distance_m"] <= 30]
-    if nearby.empty:
-        return {"is_duplicate": False, "duplicate_of": None, "similarity": None, "distance_m": None}
+    # A lexical match is already a near-verbatim resubmission; the 0.8 cut-off is for cosine similarity
+    is_dup = match["method"] == "lexical" or match["similarity"] >= 0.8
+    return {
+        "is_duplicate": bool(is_dup),
+        "duplicate_of": match["id"] if is_dup else None,
+        "method": match["method"],
+        "similarity": match["similarity"],
+        "lexical_similarity": match["lexical_similarity"],
+        "distance_m": match["distance_m"]
+    }
 
-    # compute embedding similarity
-    from sentence_transformers import SentenceTransformer
-    model = SentenceTransformer("all-MiniLM-L6-v2")
-    new_emb = model.encode(report.text).reshape(1, -1)
-    from sklearn.metrics.pairwise import cosine_similarity
-    import numpy as np
-
-    # Fix cosine_similarity type error
-    new_emb_array = new_emb.cpu().numpy() if isinstance(new_emb, torch.Tensor) else np.array(new_emb)
-    nearby["similarity"] = nearby["embedding"].apply(
-        lambda emb: float(cosine_similarity(new_emb_array, np.array(emb).reshape(1, -1))[0, 0])
-    )
-    best = nearby.sort_values("similarity", ascending=False).iloc[0]
+@app.post("/report_resolved")
+def report_resolved(body: ResolvedIn):
+    """
+    Called by the backend when reports are resolved or closed, so they stop matching
+    as duplicates right away instead of at the next sync.
+    """
+    det = _DUPLICATE_DETECTOR
+    evicted = det.mark_resolved(body.ids) if det is not None else 0
+    return {"evicted": evicted}
+
+@app.post("/assign_incident", response_model=IncidentOut)
+@profiled
+def assign_incident(report: ReportIn):
+    """
+    Adds the report to its incident cluster (or starts one) and returns the cluster stats.
+    """
+    report_time = pd.Timestamp(report.report_time or pd.Timestamp.utcnow())
+    if report_time.tzinfo is None:
+        report_time = report_time.tz_localize("UTC")
+    report_id = report.id if report.id is not None else f"anon-{time.time_ns()}"
+    with _INCIDENTS.lock:  # the cluster is read consistently with this assignment
+        cid = _INCIDENTS.assign(report_id, report.lat, report.lon, report.category, report_time.timestamp())
+        cluster = dict(_INCIDENTS.clusters[cid])
     return {
-        "is_duplicate": bool(best["similarity"] >= 0.8),
-        "duplicate_of": int(best["id"]) if best["similarity"] >= 0.8 else None,
-        "similarity": float(best["similarity"]),
-        "distance_m": float(best["distance_m"])
+        "cluster_id": cid,
+        "report_count": cluster["report_count"],
+        "centroid_lat": cluster["lat"],
+        "centroid_lon": cluster["lon"],
+        "first_seen": pd.Timestamp(cluster["first_seen"], unit="s", tz="UTC").isoformat(),
+        "last_seen": pd.Timestamp(cluster["last_seen"], unit="s", tz="UTC").isoformat(),
     }
 
 @app.post("/predict_severity", response_model=SeverityOut)
+@profiled
 def predict_severity(report: ReportIn):
     """
     Use your DistilBERT inference.py -> predict_text(text) that returns category & urgency probs etc.
     We'll call predict_text and return severity/urgency result.
     """
     try:
-        res = severity_inference.predict_text(report.text)
+        res = predict_severity_cached(report.text)
         # adapt response shape - your inference returns category, urgency, probs etc.
         # We'll return severity as "urgency" label and its probs
         return {
@@ -198,7 +314,26 @@ def predict_severity(report: ReportIn):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Severity inference error: {e}")
 
+@app.post("/predict_severity_batch")
+def predict_severity_batch(reports: List[ReportIn]):
+    """NDJSON stream, one {"index", "id", "severity", "severity_probs"} line per report as soon as it is scored."""
+    def rows():
+        for i, report in enumerate(reports):
+            try:
+                res = predict_severity_cached(report.text)
+                yield {
+                    "index": i,
+                    "id": report.id,
+                    "severity": res.get("urgency", "unknown"),
+                    "severity_probs": res.get("urgency_probs", {})
+                }
+            except Exception as e:
+                yield {"index": i, "id": report.id, "error": f"Severity inference error: {e}"}
+
+    return ndjson_response(rows())
+
 @app.post("/predict_priority", response_model=PriorityOut)
+@profiled
 def predict_priority(report: ReportIn):
     """
     Runs feature engineering and CatBoost model for priority prediction.
@@ -207,10 +342,14 @@ def predict_priority(report: ReportIn):
         raise HTTPException(status_code=500, detail="Priority model not loaded on server")
 
     # build dataframe for feature_engineering (single row)
+    report_count = int(report.report_count or 1)
+    if report.id is not None:
+        # incident size from the online clusterer when it knows this report
+        report_count = max(report_count, _INCIDENTS.report_count(report.id))
     df = pd.DataFrame([{
         "id": report.id if report.id is not None else -1,
         "category": report.category if report.category is not None else "other",
-        "report_count": int(report.report_count or 1),
+        "report_count": report_count,
         "lat": float(report.lat),
         "lon": float(report.lon),
         "report_time": report.report_time or pd.Timestamp.utcnow().isoformat()
@@ -218,7 +357,7 @@ def predict_priority(report: ReportIn):
 
     # If severity is desired as input, call predict_severity (we do that here to fill urgency score)
     try:
-        sev = severity_inference.predict_text(report.text)
+        sev = predict_severity_cached(report.text)
         urgency_high = sev.get("urgency_probs", {}).get("high", 0.0)
         urgency_df = pd.DataFrame([{"id": df.loc[0,"id"], "urgency_high_prob": float(urgency_high)}])
     except Exception:
@@ -245,6 +384,7 @@ def predict_priority(report: ReportIn):
     }
 
 @app.post("/route_report", response_model=RouteOut)
+@profiled
 def route_report(report: ReportIn):
     """
     Calls predict_priority and maps to department and returns queue score
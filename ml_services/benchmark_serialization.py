@@ -0,0 +1,102 @@
+# Encode/decode cost and size of the ML API payloads for each wire format
+# (stdlib json, orjson, MessagePack; missing libraries are skipped).
+#
+# Usage: python benchmark_serialization.py [--reports 50 500 5000] [--batch 1000]
+import argparse
+import json
+import random
+import time
+
+import wire
+
+CATEGORIES = ["drainage", "garbage", "noise pollution", "other", "parks", "pothole",
+              "public transport", "stray animals", "streetlight", "water supply"]
+URGENCIES = ["high", "low", "medium"]
+WORDS = ("pothole garbage overflowing drain blocked near school hospital road water leak "
+         "streetlight broken since last week traffic market residents complaint").split()
+
+
+def make_text(rng, words=25):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+def probs(rng, classes):
+    raw = [rng.random() for _ in classes]
+    total = sum(raw)
+    return {c: r / total for c, r in zip(classes, raw)}
+
+def duplicate_request(rng, n):
+    """A /detect_duplicate body with n existing reports, as sent by the backend."""
+    return {
+        "lat": 28.61, "lon": 77.23, "text": make_text(rng), "category": "pothole",
+        "existing_reports": [{
+            "id": i,
+            "lat": 28.6 + rng.random() / 50,
+            "lon": 77.2 + rng.random() / 50,
+            "text": make_text(rng),
+            "category": rng.choice(CATEGORIES),
+            "status": "open",
+            "created_at": "2025-09-%02dT%02d:%02d:00+00:00" % (rng.randint(1, 28), rng.randint(0, 23), rng.randint(0, 59)),
+        } for i in range(n)],
+    }
+
+def severity_response(rng):
+    return {
+        "severity": {
+            "category": rng.choice(CATEGORIES),
+            "category_probs": probs(rng, CATEGORIES),
+            "urgency": rng.choice(URGENCIES),
+            "urgency_probs": probs(rng, URGENCIES),
+        },
+        "model_version": "3f9c2a1b7d4e",
+    }
+
+def stdlib_encode(obj):
+    # what FastAPI's JSONResponse does
+    return json.dumps(obj, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+def formats():
+    yield "json", stdlib_encode, json.loads
+    if wire.orjson is not None:
+        yield "orjson", lambda o: wire.encode(o, wire.JSON_TYPE), lambda b: wire.decode(b, wire.JSON_TYPE)
+    if wire.msgpack is not None:
+        mt = wire.MSGPACK_TYPES[0]
+        yield "msgpack", lambda o: wire.encode(o, mt), lambda b: wire.decode(b, mt)
+
+def bench(fn, arg, min_seconds=0.2):
+    runs, started = 0, time.perf_counter()
+    while True:
+        fn(arg)
+        runs += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_seconds and runs >= 3:
+            return 1e6 * elapsed / runs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark wire formats on realistic ML API payloads")
+    parser.add_argument("--reports", type=int, nargs="+", default=[50, 500, 5000], help="existing_reports sizes")
+    parser.add_argument("--batch", type=int, default=1000, help="responses in a /predict_severity_batch stream")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    payloads = [(f"detect_duplicate request ({n} reports)", duplicate_request(rng, n)) for n in args.reports]
+    payloads.append(("predict_severity response", severity_response(rng)))
+    batch = [severity_response(rng) for _ in range(args.batch)]
+
+    rows = []
+    for label, payload in payloads:
+        for name, enc, dec in formats():
+            body = enc(payload)
+            rows.append((label, name, len(body), bench(enc, payload), bench(dec, body)))
+    # NDJSON stream: one encode per line, measured over the whole batch
+    for name, enc, _ in formats():
+        if name == "msgpack":
+            continue
+        lines = [enc(r) + b"\n" for r in batch]
+        rows.append((f"severity NDJSON stream ({args.batch} lines)", name, sum(map(len, lines)),
+                     bench(lambda rs: [enc(r) + b"\n" for r in rs], batch), None))
+
+    print(f"\n{'payload':45} {'format':8} {'bytes':>10} {'encode us':>11} {'decode us':>11}")
+    for label, name, size, enc_us, dec_us in rows:
+        dec = f"{dec_us:11.1f}" if dec_us is not None else f"{'-':>11}"
+        print(f"{label:45} {name:8} {size:10d} {enc_us:11.1f} {dec}")
@@ -0,0 +1,124 @@
+# Confidence-based severity cascade: a hashed n-gram linear model (train_cascade.py)
+# answers first and only low-confidence reports go on to DistilBERT.
+# Output has the same schema as inference.predict_text.
+import os
+import threading
+import time
+
+import joblib
+import numpy as np
+
+import inference  # loads DistilBERT at startup, not on the first escalated request
+from train_cascade import CASCADE_MODEL_PATH, make_vectorizer
+
+CASCADE_ENABLED = os.getenv("SEVERITY_CASCADE", "0") == "1"
+
+_cascade = None
+if CASCADE_ENABLED:
+    if os.path.exists(CASCADE_MODEL_PATH):
+        _cascade = joblib.load(CASCADE_MODEL_PATH)
+        # the features the classifiers were trained on, even if the defaults have changed since
+        _vectorizer = make_vectorizer(_cascade["vectorizer_params"])
+        print(f"Loaded severity cascade model (threshold={_cascade['threshold']}).")
+    else:
+        print(f"Warning: SEVERITY_CASCADE=1 but {CASCADE_MODEL_PATH} is missing, using DistilBERT only")
+
+CASCADE_THRESHOLD = float(os.getenv("CASCADE_THRESHOLD", _cascade["threshold"] if _cascade else 0.85))
+
+CASCADE_STATS = {"requests": 0, "escalations": 0, "light_seconds": 0.0, "heavy_seconds": 0.0}
+_stats_lock = threading.Lock()  # requests run concurrently in the FastAPI threadpool
+
+def _count(**deltas):
+    with _stats_lock:
+        for key, delta in deltas.items():
+            CASCADE_STATS[key] += delta
+
+def _probs(clf, proba):
+    return {str(cls): float(p) for cls, p in zip(clf.classes_, proba)}
+
+def _light_result(cat_proba, urg_proba):
+    return {
+        "category": str(_cascade["cat_clf"].classes_[int(np.argmax(cat_proba))]),
+        "category_probs": _probs(_cascade["cat_clf"], cat_proba),
+        "urgency": str(_cascade["urg_clf"].classes_[int(np.argmax(urg_proba))]),
+        "urgency_probs": _probs(_cascade["urg_clf"], urg_proba),
+    }
+
+def predict_light(text):
+    """(result, confident) from the linear model alone."""
+    X = _vectorizer.transform([str(text)])
+    cat_proba = _cascade["cat_clf"].predict_proba(X)[0]
+    urg_proba = _cascade["urg_clf"].predict_proba(X)[0]
+    confident = cat_proba.max() >= CASCADE_THRESHOLD and urg_proba.max() >= CASCADE_THRESHOLD
+    return _light_result(cat_proba, urg_proba), confident
+
+def predict_text(text, return_embedding=False, bundle=None):
+    """Drop-in for inference.predict_text; embeddings always need the DistilBERT pass."""
+    if _cascade is None or return_embedding:
+        return inference.predict_text(text, return_embedding=return_embedding, bundle=bundle)
+
+    started = time.perf_counter()
+    result, confident = predict_light(text)
+    _count(requests=1, light_seconds=time.perf_counter() - started)
+    if confident:
+        return result
+
+    started = time.perf_counter()
+    result = inference.predict_text(text, bundle=bundle)
+    _count(escalations=1, heavy_seconds=time.perf_counter() - started)
+    return result
+
+def predict_batch(texts, batch_size=32):
+    """Drop-in for inference.predict_batch: one linear pass over all texts, batched DistilBERT for the rest."""
+    texts = [str(t) for t in texts]
+    if _cascade is None or not texts:
+        return inference.predict_batch(texts, batch_size=batch_size)
+
+    started = time.perf_counter()
+    X = _vectorizer.transform(texts)
+    cat_proba = _cascade["cat_clf"].predict_proba(X)
+    urg_proba = _cascade["urg_clf"].predict_proba(X)
+    results = [_light_result(c, u) for c, u in zip(cat_proba, urg_proba)]
+    escalate = np.flatnonzero((cat_proba.max(axis=1) < CASCADE_THRESHOLD) | (urg_proba.max(axis=1) < CASCADE_THRESHOLD))
+    _count(requests=len(texts), light_seconds=time.perf_counter() - started)
+
+    if len(escalate):
+        started = time.perf_counter()
+        heavy = inference.predict_batch([texts[i] for i in escalate], batch_size=batch_size)
+        _count(escalations=len(escalate), heavy_seconds=time.perf_counter() - started)
+        for i, result in zip(escalate.tolist(), heavy):
+            results[i] = result
+    return results
+
+def _version(bundle):
+    if _cascade is None:
+        return bundle.version
+    return f"{bundle.version}+cascade:{_cascade.get('trained_at', 0):.0f}@{CASCADE_THRESHOLD}"
+
+def model_version():
+    """Identity of whatever answers predict_text, used to key cached results."""
+    return _version(inference.active_model())
+
+def predict_versioned(text, return_embedding=False):
+    """
+    (predict_text result, model_version) taken from the same checkpoint, so a hot swap
+    between the two can never label a new model's result with the old version.
+    """
+    bundle = inference.active_model()
+    return predict_text(text, return_embedding=return_embedding, bundle=bundle), _version(bundle)
+
+def cascade_stats():
+    with _stats_lock:
+        stats = dict(CASCADE_STATS)
+    requests, escalations = stats["requests"], stats["escalations"]
+    return {
+        "enabled": _cascade is not None,
+        "threshold": CASCADE_THRESHOLD,
+        "requests": requests,
+        "escalations": escalations,
+        "escalation_rate": escalations / requests if requests else 0.0,
+        "avg_light_ms": 1000.0 * stats["light_seconds"] / requests if requests else 0.0,
+        "avg_distilbert_ms": 1000.0 * stats["heavy_seconds"] / escalations if escalations else 0.0,
+        # offline escalation/accuracy sweep recorded by train_cascade.py
+        "validation": _cascade["validation"] if _cascade else None,
+    }
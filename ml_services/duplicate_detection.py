@@ -1,8 +1,87 @@
+import logging
+import os
+import threading
+import time
 import numpy as np
 import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
 from sentence_transformers import SentenceTransformer
 
+from duplicate_index import DuplicateIndex, RESOLVED_STATUSES
+from simhash import SIMHASH_BITS, simhash, simhash_many
+
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+DUPLICATE_ENCODER = os.getenv("DUPLICATE_ENCODER", "minilm")  # "minilm" or "distilbert"
+script_dir = os.path.dirname(os.path.abspath(__file__))
+logger = logging.getLogger(__name__)
+SNAPSHOT_DIR = os.getenv("DUPLICATE_SNAPSHOT_DIR", os.path.join(script_dir, "model", "duplicate_index"))
+
+# Recalibrate with evaluate_duplicate_encoders.py when switching encoder
+DUPLICATE_SCORE_THRESHOLD = float(os.getenv("DUPLICATE_SCORE_THRESHOLD", "0.4"))
+
+# === Encoders ===
+class MiniLMEncoder:
+    def __init__(self, name=EMBEDDING_MODEL_NAME):
+        self.model = SentenceTransformer(name)
+        self.name = name
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts):
+        return self.model.encode(
+            list(texts), batch_size=64, convert_to_numpy=True, normalize_embeddings=True
+        ).astype(np.float32)
+
+class DistilBertEncoder:
+    """Pooled embeddings from the severity model in inference.py, so no second transformer is loaded."""
+    def __init__(self):
+        import inference
+        self._inference = inference
+        self.dim = inference.model.backbone.config.hidden_size
+
+    @property
+    def name(self):
+        # follows hot reloads, so indexes built with an older checkpoint are re-embedded
+        return self._inference.EMBEDDING_MODEL_NAME
+
+    def encode(self, texts):
+        return self._inference.embed_texts(list(texts))
+
+_ENCODERS = {}
+
+def get_encoder(kind=DUPLICATE_ENCODER):
+    # Loading the encoder is the slow part of a cold start, so share it
+    if kind not in _ENCODERS:
+        if kind == "distilbert":
+            _ENCODERS[kind] = DistilBertEncoder()
+        elif kind == "minilm":
+            _ENCODERS[kind] = MiniLMEncoder()
+        else:
+            raise ValueError(f"Unknown duplicate encoder: {kind}")
+    return _ENCODERS[kind]
+
+# Process-wide counters for the lexical short-circuit, exposed through /metrics
+DUPLICATE_STATS = {"checks": 0, "short_circuits": 0, "encoded_texts": 0, "encode_seconds": 0.0, "skipped_texts": 0}
+
+def _timed_encode(encoder, texts):
+    started = time.perf_counter()
+    embeddings = encoder.encode(texts)
+    DUPLICATE_STATS["encoded_texts"] += len(texts)
+    DUPLICATE_STATS["encode_seconds"] += time.perf_counter() - started
+    return embeddings
+
+def duplicate_stats():
+    checks = DUPLICATE_STATS["checks"]
+    encoded = DUPLICATE_STATS["encoded_texts"]
+    avg_encode_ms = 1000.0 * DUPLICATE_STATS["encode_seconds"] / encoded if encoded else 0.0
+    return {
+        "checks": checks,
+        "short_circuits": DUPLICATE_STATS["short_circuits"],
+        "short_circuit_rate": DUPLICATE_STATS["short_circuits"] / checks if checks else 0.0,
+        "avg_encode_ms": avg_encode_ms,  # per text
+        # texts a short-circuit never encoded: the query, plus the corpus of a deferred detector
+        "skipped_texts": DUPLICATE_STATS["skipped_texts"],
+        "encode_ms_saved": DUPLICATE_STATS["skipped_texts"] * avg_encode_ms,
+    }
+
 # === Utilities ===
 def haversine(lat1, lon1, lat2, lon2):
     R = 6371000  # Earth radius in meters
@@ -14,61 +93,192 @@ def haversine(lat1, lon1, lat2, lon2):
 
 # === Duplicate Detector ===
 class DuplicateDetector:
-    def __init__(self, existing_reports: pd.DataFrame):
+    def __init__(self, existing_reports: pd.DataFrame, previous_index: DuplicateIndex = None, index: DuplicateIndex = None,
+                 encoder=None, defer_encoding=False):
         """
-        existing_reports: DataFrame with columns ['id', 'lat', 'lon', 'text']
+        existing_reports: DataFrame with columns ['id', 'lat', 'lon', 'text'] and optionally
+            ['category', 'status', 'created_at']; resolved reports are not indexed
+        previous_index: embeddings of ids already present in it are reused instead of re-encoded
+        index: a ready-made index (e.g. a loaded snapshot); existing_reports is ignored
+        encoder: defaults to get_encoder(), i.e. the DUPLICATE_ENCODER setting
+        defer_encoding: only SimHash the existing reports up front and encode them the first
+            time a query gets past the lexical short-circuit (detectors built per request)
         """
-        self.df = existing_reports.copy()
-        self.model = SentenceTransformer("all-MiniLM-L6-v2")
+        self.encoder = encoder if encoder is not None else get_encoder()
+        self.model_name = self.encoder.name
+        self.dim = self.encoder.dim
+        self.defer_encoding = defer_encoding
+        self._pending_texts = {}  # id -> text of reports whose embedding is deferred
 
-        # Precompute embeddings as matrix
-        # Convert Series of arrays to list, then stack
-        self.embeddings = np.vstack(self.df["text"].apply(lambda t: self.model.encode(t)).tolist())
+        # Queries read self.index once and use that object; evictions build a new
+        # index and swap the reference under this lock, so readers never see a mix
+        self._evict_lock = threading.Lock()
+        if index is not None:
+            self.index = index
+        else:
+            self.index = self._build_index(existing_reports, previous_index)
+        self.df = pd.DataFrame({
+            "id": self.index.ids,
+            "lat": self.index.coords[:, 0],
+            "lon": self.index.coords[:, 1],
+        })
 
-    def check_duplicate(self, new_report, distance_threshold=200):
-        lat, lon, text = new_report["lat"], new_report["lon"], new_report["text"]
+    @classmethod
+    def from_snapshot(cls, root=SNAPSHOT_DIR, encoder=None):
+        """Warm start from the on-disk snapshot; returns None if there is no usable one."""
+        encoder = encoder if encoder is not None else get_encoder()
+        index = DuplicateIndex.load_snapshot(root, encoder.name, encoder.dim)
+        if index is None:
+            return None
+        return cls(None, index=index, encoder=encoder)
+
+    def save_snapshot(self, root=SNAPSHOT_DIR):
+        return self._embed_pending().save_snapshot(root)
 
-        # Step 1: Spatial filter (wider net)
-        self.df["distance"] = self.df.apply(
-            lambda row: haversine(lat, lon, row["lat"], row["lon"]), axis=1
-        )
-        nearby_idx = self.df[self.df["distance"] <= distance_threshold].index
-        if nearby_idx.empty:
-            print(f"[DEBUG] No reports within {distance_threshold}m")
-            return False, None
-
-        # Step 2: Text similarity
-        new_emb = self.model.encode(text).reshape(1, -1)
-        sims = cosine_similarity(new_emb, self.embeddings[nearby_idx])[0]
-
-        scores = []
-        for idx, sim in zip(nearby_idx, sims):
-            dist_val = self.df.loc[idx, "distance"]
-            try:
-                import numpy as np
-                if isinstance(dist_val, np.generic):
-                    dist_val = dist_val.item()
-                if isinstance(dist_val, (int, float)):
-                    dist = float(dist_val)
+    def _build_index(self, existing_reports, previous_index):
+        df = existing_reports if existing_reports is not None else pd.DataFrame([], columns=["id", "lat", "lon", "text"])
+        df = df.dropna(subset=["lat", "lon", "text"])
+        if "status" in df.columns:
+            df = df[~df["status"].astype(str).str.lower().isin(RESOLVED_STATUSES)]
+        df = df.reset_index(drop=True)
+        embeddings = np.zeros((len(df), self.dim), dtype=np.float32)
+        simhashes = np.zeros(len(df), dtype=np.uint64)
+
+        # Only encode reports the previous index has not seen
+        to_encode = list(range(len(df)))
+        if previous_index is not None and previous_index.model_name == self.model_name and previous_index.dim == self.dim:
+            known = previous_index.embeddings_by_id()
+            to_encode = []
+            for pos, report_id in enumerate(df["id"].astype(str)):
+                if report_id in known:
+                    embeddings[pos] = previous_index.embeddings[known[report_id]]
+                    simhashes[pos] = previous_index.simhashes[known[report_id]]
                 else:
-                    dist = 0.0
-            except Exception:
-                dist = 0.0
-            score = sim * (1 - dist / float(distance_threshold))  # weight by distance
-            scores.append((idx, sim, dist, score))
+                    to_encode.append(pos)
+
+        if to_encode:
+            texts = df["text"].iloc[to_encode].astype(str).tolist()
+            simhashes[to_encode] = simhash_many(texts)
+            if self.defer_encoding:
+                self._pending_texts = dict(zip(df["id"].iloc[to_encode].astype(str), texts))
+            else:
+                embeddings[to_encode] = _timed_encode(self.encoder, texts)
+        logger.debug("Duplicate index: %d reports, %d new (%s)", len(df), len(to_encode), "encoding deferred" if self.defer_encoding else "embedded")
+
+        coords = df[["lat", "lon"]].to_numpy(dtype=np.float64)
+        categories = df["category"].to_numpy(dtype=object) if "category" in df.columns else None
+        times = None
+        if "created_at" in df.columns:
+            created = pd.to_datetime(df["created_at"], utc=True, errors="coerce")
+            times = (created - pd.Timestamp(0, tz="UTC")).dt.total_seconds().to_numpy(dtype=np.float64)
+        index = DuplicateIndex(df["id"].to_numpy(), coords, embeddings, self.model_name,
+                               categories=categories, times=times, simhashes=simhashes)
+        return index.evicted()
+
+    def _evict(self, resolved_ids=None):
+        """Swap in the evicted index and return it along with the number of dropped rows."""
+        with self._evict_lock:
+            index = self.index
+            evicted = index.evicted(resolved_ids=resolved_ids)
+            self.index = evicted
+        return evicted, len(index) - len(evicted)
+
+    def _embed_pending(self):
+        """Encode the deferred reports still in the index and swap in the completed index."""
+        with self._evict_lock:
+            index = self.index
+            if not self._pending_texts:
+                return index
+            ids = index.ids.astype(str).tolist()
+            rows = [pos for pos, report_id in enumerate(ids) if report_id in self._pending_texts]
+            embeddings = np.array(index.embeddings, dtype=np.float32)
+            if rows:
+                embeddings[rows] = _timed_encode(self.encoder, [self._pending_texts[ids[pos]] for pos in rows])
+            # same sort order, so pass the buckets through instead of re-sorting
+            index = DuplicateIndex(index.ids, index.coords, embeddings, index.model_name,
+                                   categories=index.categories, times=index.times, simhashes=index.simhashes,
+                                   buckets=index.buckets, created_at=index.created_at, window_seconds=index.window_seconds)
+            self.index = index
+            self._pending_texts = {}
+        return index
+
+    def mark_resolved(self, report_ids):
+        """Evict resolved reports without waiting for the next sync."""
+        return self._evict(resolved_ids=report_ids)[1]
+
+    def find_best_match(self, new_report, distance_threshold=200):
+        """
+        Best nearby candidate as a dict, or None. "method" is "lexical" for a SimHash
+        near-verbatim hit, which sets "lexical_similarity" (1 - differing bits / 64), or
+        "embedding", which sets the cosine "similarity"; the other field is None.
+        "score" is that similarity weighted by distance.
+        new_report may carry a precomputed normalised "embedding" from the same encoder,
+        e.g. from inference.predict_text(text, return_embedding=True), to skip the encode.
+        """
+        lat, lon, text = new_report["lat"], new_report["lon"], new_report["text"]
+        category = new_report.get("category")
+        index, _ = self._evict()  # cheap no-op unless something left the window
+        DUPLICATE_STATS["checks"] += 1
+
+        # Step 0: Near-verbatim resubmissions via SimHash LSH, skips the encode entirely
+        lex_pos, lex_dists, lex_bits = index.near_verbatim(lat, lon, distance_threshold, simhash(text), category=category)
+        if len(lex_pos):
+            lex_sims = 1.0 - lex_bits / float(SIMHASH_BITS)
+            lex_scores = lex_sims * (1 - lex_dists / float(distance_threshold))
+            best = int(np.argmax(lex_scores))
+            if lex_scores[best] > DUPLICATE_SCORE_THRESHOLD:
+                DUPLICATE_STATS["short_circuits"] += 1
+                DUPLICATE_STATS["skipped_texts"] += len(self._pending_texts) + (new_report.get("embedding") is None)
+                match = self._match(index, lex_pos[best], lex_dists[best], lex_scores[best], "lexical", lexical_similarity=lex_sims[best])
+                logger.debug("Near-verbatim candidate %s → dist=%.1fm, bits=%d", match["id"], match["distance_m"], int(lex_bits[best]))
+                return match
+
+        # Step 1: Spatial filter (wider net), only over open reports of the same category in the time window
+        nearby_pos, dists = index.nearby(lat, lon, distance_threshold, category=category)
+        if len(nearby_pos) == 0:
+            logger.debug("No recent reports within %sm", distance_threshold)
+            return None
+
+        # Step 2: Text similarity (embeddings are normalised, so cosine == dot)
+        if self._pending_texts:
+            index = self._embed_pending()
+            nearby_pos, dists = index.nearby(lat, lon, distance_threshold, category=category)
+            if len(nearby_pos) == 0:
+                return None
+        new_emb = new_report.get("embedding")
+        if new_emb is None:
+            new_emb = _timed_encode(self.encoder, [text])[0]
+        new_emb = np.asarray(new_emb, dtype=np.float32)
+        sims = index.embeddings[nearby_pos] @ new_emb
+        scores = sims * (1 - dists / float(distance_threshold))  # weight by distance
 
         # Best candidate
-        best_idx, best_sim, best_dist, best_score = max(scores, key=lambda x: x[3])
-        print(f"[DEBUG] Best candidate {self.df.loc[best_idx,'id']} → dist={best_dist:.1f}m, sim={best_sim:.2f}, score={best_score:.2f}")
+        best = int(np.argmax(scores))
+        match = self._match(index, nearby_pos[best], dists[best], scores[best], "embedding", similarity=sims[best])
+        logger.debug("Best candidate %s → dist=%.1fm, sim=%.2f, score=%.2f", match["id"], match["distance_m"], match["similarity"], match["score"])
+        return match
+
+    def _match(self, index, pos, distance, score, method, similarity=None, lexical_similarity=None):
+        return {
+            "id": index.ids[pos].item(),
+            "similarity": None if similarity is None else float(similarity),
+            "lexical_similarity": None if lexical_similarity is None else float(lexical_similarity),
+            "distance_m": float(distance),
+            "score": float(score),
+            "method": method,
+        }
 
-        if best_score > 0.4:  # tune threshold
-            return True, self.df.loc[best_idx, "id"]
+    def check_duplicate(self, new_report, distance_threshold=200):
+        match = self.find_best_match(new_report, distance_threshold)
+        if match is not None and match["score"] > DUPLICATE_SCORE_THRESHOLD:
+            return True, match["id"]
         return False, None
 
 
 
 # === Example Usage ===
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.DEBUG)
     existing = pd.DataFrame([
         {"id": 1, "lat": 98.610, "lon": 97.230, "text": "Pothole near Connaught Place"},
         {"id": 2, "lat": 8.611, "lon": 7.231, "text": "Garbage dump overflowing"},
@@ -0,0 +1,300 @@
+import json
+import logging
+import os
+import shutil
+import time
+
+import numpy as np
+
+from simhash import MAX_HAMMING, SimHashLSH, hamming
+
+# === Config ===
+SNAPSHOT_VERSION = 3
+BUCKET_DEG = 0.005          # ~550m grid cells for the spatial pre-filter
+TIME_BUCKET_SECONDS = 7 * 24 * 3600
+WINDOW_SECONDS = float(os.getenv("DUPLICATE_WINDOW_DAYS", "30")) * 24 * 3600
+RESOLVED_STATUSES = {"resolved", "closed"}
+EARTH_RADIUS_M = 6371000
+KEEP_SNAPSHOTS = 2          # older snapshots are pruned after each write
+
+logger = logging.getLogger(__name__)
+
+_CELL_OFFSET = 1 << 20
+_CELL_STRIDE = 1 << 21
+
+
+# === Utilities ===
+def haversine_np(lat, lon, lats, lons):
+    """Vectorized haversine distance (meters) from one point to many."""
+    phi1, phi2 = np.radians(lat), np.radians(lats)
+    dphi = phi2 - phi1
+    dlambda = np.radians(lons - lon)
+    a = np.sin(dphi/2)**2 + np.cos(phi1)*np.cos(phi2)*np.sin(dlambda/2)**2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+def bucket_keys(lats, lons):
+    """Map coordinates to int64 grid-cell keys."""
+    lat_idx = np.floor(np.asarray(lats, dtype=np.float64) / BUCKET_DEG).astype(np.int64)
+    lon_idx = np.floor(np.asarray(lons, dtype=np.float64) / BUCKET_DEG).astype(np.int64)
+    return (lat_idx + _CELL_OFFSET) * _CELL_STRIDE + (lon_idx + _CELL_OFFSET)
+
+def neighbour_keys(lat, lon, radius_m):
+    """All grid-cell keys that intersect the bounding box of a radius around a point."""
+    dlat = radius_m / 111320.0
+    dlon = radius_m / (111320.0 * max(np.cos(np.radians(lat)), 0.01))
+    lat_range = np.arange(np.floor((lat - dlat) / BUCKET_DEG), np.floor((lat + dlat) / BUCKET_DEG) + 1, dtype=np.int64)
+    lon_range = np.arange(np.floor((lon - dlon) / BUCKET_DEG), np.floor((lon + dlon) / BUCKET_DEG) + 1, dtype=np.int64)
+    keys = (lat_range[:, None] + _CELL_OFFSET) * _CELL_STRIDE + (lon_range[None, :] + _CELL_OFFSET)
+    return keys.ravel()
+
+def time_buckets(times):
+    return np.floor(np.asarray(times, dtype=np.float64) / TIME_BUCKET_SECONDS).astype(np.int64)
+
+
+# === Duplicate Index ===
+class DuplicateIndex:
+    """
+    Rows are partitioned by (category, time bucket) and sorted by spatial bucket
+    inside each partition, so a query only touches the partitions of its
+    category inside the time window, and within those a radius lookup is a
+    handful of searchsorted calls instead of a scan.
+    Embeddings are L2-normalised float32, so cosine similarity is a dot product.
+    SimHash signatures are indexed with banded LSH for the near-verbatim path.
+    """
+    def __init__(self, ids, coords, embeddings, model_name, categories=None, times=None,
+                 simhashes=None, buckets=None, created_at=None, window_seconds=WINDOW_SECONDS):
+        self.created_at = created_at if created_at is not None else time.time()
+        self.window_seconds = window_seconds
+
+        ids = np.asarray(ids)
+        if ids.dtype == object:
+            ids = ids.astype(str)
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        n = len(ids)
+
+        # Unknown category goes to the "" partition, which every query also checks
+        categories = np.full(n, "", dtype="U1") if categories is None else np.asarray(categories)
+        if categories.dtype == object:
+            categories = np.array(["" if c is None or c != c else str(c) for c in categories])
+        # Unknown report time counts as "seen at build time" so it is not evicted straight away
+        times = np.full(n, self.created_at) if times is None else np.asarray(times, dtype=np.float64)
+        times = np.where(np.isnan(times), self.created_at, times)
+        simhashes = np.zeros(n, dtype=np.uint64) if simhashes is None else np.asarray(simhashes, dtype=np.uint64)
+
+        if buckets is None:
+            categories = np.char.lower(categories.astype(str))
+            buckets = bucket_keys(coords[:, 0], coords[:, 1])
+            order = np.lexsort((buckets, time_buckets(times), categories))
+            ids, coords, embeddings = ids[order], coords[order], embeddings[order]
+            categories, times, buckets = categories[order], times[order], buckets[order]
+            simhashes = simhashes[order]
+
+        self.ids = ids
+        self.coords = coords
+        self.embeddings = embeddings
+        self.categories = categories
+        self.times = times
+        self.simhashes = simhashes
+        self.buckets = buckets
+        self.model_name = model_name
+        self._build_partitions()
+
+    def _build_partitions(self):
+        """(category, time bucket) -> (start, end) row slice, plus the LSH table."""
+        self.partitions = {}
+        self.lsh = SimHashLSH(self.simhashes)
+        n = len(self.ids)
+        if n == 0:
+            self._oldest = np.inf
+            return
+        tb = time_buckets(self.times)
+        change = (self.categories[1:] != self.categories[:-1]) | (tb[1:] != tb[:-1])
+        starts = np.concatenate(([0], np.nonzero(change)[0] + 1))
+        ends = np.concatenate((starts[1:], [n]))
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            self.partitions[(str(self.categories[start]), int(tb[start]))] = (start, end)
+        self._oldest = float(np.min(self.times))
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def dim(self):
+        return int(self.embeddings.shape[1]) if self.embeddings.ndim == 2 else 0
+
+    def embeddings_by_id(self):
+        """id -> row position, used to reuse embeddings across syncs."""
+        return {str(i): pos for pos, i in enumerate(self.ids.tolist())}
+
+    def evicted(self, now=None, resolved_ids=None):
+        """
+        Index without reports older than the window and without resolved ids.
+        Never modifies self, so concurrent queries keep a consistent view; returns
+        self when nothing is stale, which makes the common case a cheap no-op.
+        """
+        cutoff = (now if now is not None else time.time()) - self.window_seconds
+        if self._oldest >= cutoff and not resolved_ids:
+            return self
+
+        keep = self.times >= cutoff
+        if resolved_ids:
+            keep &= ~np.isin(self.ids.astype(str), np.asarray([str(i) for i in resolved_ids]))
+        if keep.all():
+            return self
+        # Boolean indexing keeps the partition/bucket sort order
+        return DuplicateIndex(
+            self.ids[keep], self.coords[keep], self.embeddings[keep], self.model_name,
+            categories=self.categories[keep], times=self.times[keep], simhashes=self.simhashes[keep],
+            buckets=self.buckets[keep], created_at=self.created_at, window_seconds=self.window_seconds,
+        )
+
+    def nearby(self, lat, lon, radius_m, category=None, now=None):
+        """
+        Return (row positions, distances in meters) of rows within radius_m,
+        restricted to the category's partitions (plus uncategorised ones) in the time window.
+        """
+        empty = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        if len(self) == 0:
+            return empty
+
+        cutoff = (now if now is not None else time.time()) - self.window_seconds
+        min_tb = int(np.floor(cutoff / TIME_BUCKET_SECONDS))
+        category = category.lower() if category else None
+
+        keys = neighbour_keys(lat, lon, radius_m)
+        spans = []
+        for (part_cat, part_tb), (start, end) in self.partitions.items():
+            if part_tb < min_tb or (category is not None and part_cat not in (category, "")):
+                continue
+            part_buckets = self.buckets[start:end]
+            left = np.searchsorted(part_buckets, keys, side="left")
+            right = np.searchsorted(part_buckets, keys, side="right")
+            spans.extend(np.arange(start + l, start + r) for l, r in zip(left, right) if r > l)
+        if not spans:
+            return empty
+
+        pos = np.concatenate(spans)
+        pos = pos[self.times[pos] >= cutoff]
+        dist = haversine_np(lat, lon, self.coords[pos, 0], self.coords[pos, 1])
+        keep = dist <= radius_m
+        return pos[keep], dist[keep]
+
+    def near_verbatim(self, lat, lon, radius_m, sig, category=None, now=None, max_hamming=MAX_HAMMING):
+        """
+        LSH lookup for near-verbatim texts, restricted to the same spatial radius,
+        category and time window as nearby(). Returns (positions, distances, bit distances).
+        """
+        empty = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64), np.empty(0, dtype=np.int64)
+        if len(self) == 0 or sig == 0:
+            return empty
+
+        pos = self.lsh.candidates(sig, max_hamming)
+        cutoff = (now if now is not None else time.time()) - self.window_seconds
+        keep = self.times[pos] >= cutoff
+        if category:
+            keep &= np.isin(self.categories[pos], [category.lower(), ""])
+        pos = pos[keep]
+        if len(pos) == 0:
+            return empty
+
+        dist = haversine_np(lat, lon, self.coords[pos, 0], self.coords[pos, 1])
+        keep = dist <= radius_m
+        pos, dist = pos[keep], dist[keep]
+        return pos, dist, hamming(sig, self.simhashes[pos])
+
+    # === Snapshots ===
+    def save_snapshot(self, root):
+        """
+        Atomically write a new snapshot under root and repoint root/CURRENT at it.
+        Readers either see the previous snapshot or the complete new one.
+        """
+        os.makedirs(root, exist_ok=True)
+        name = f"snap-{time.time_ns()}"
+        tmp_dir = os.path.join(root, f".{name}.tmp")
+        os.makedirs(tmp_dir)
+
+        arrays = {
+            "ids": self.ids,
+            "coords": self.coords,
+            "embeddings": self.embeddings,
+            "categories": self.categories,
+            "times": self.times,
+            "simhashes": self.simhashes,
+            "buckets": self.buckets,
+        }
+        for key, arr in arrays.items():
+            _write_fsync(os.path.join(tmp_dir, f"{key}.npy"), lambda f, a=arr: np.save(f, np.ascontiguousarray(a)))
+
+        meta = {
+            "version": SNAPSHOT_VERSION,
+            "model_name": self.model_name,
+            "dim": self.dim,
+            "count": len(self),
+            "bucket_deg": BUCKET_DEG,
+            "time_bucket_seconds": TIME_BUCKET_SECONDS,
+            "created_at": self.created_at,
+        }
+        _write_fsync(os.path.join(tmp_dir, "meta.json"), lambda f: f.write(json.dumps(meta).encode()))
+
+        os.rename(tmp_dir, os.path.join(root, name))
+        current_tmp = os.path.join(root, "CURRENT.tmp")
+        _write_fsync(current_tmp, lambda f: f.write(name.encode()))
+        os.replace(current_tmp, os.path.join(root, "CURRENT"))
+
+        _prune_snapshots(root, keep=name)
+        return os.path.join(root, name)
+
+    @classmethod
+    def load_snapshot(cls, root, model_name, dim=None):
+        """
+        Memory-map the current snapshot under root. Returns None if there is no
+        snapshot or it was built with a different model, dimension or format.
+        """
+        current = os.path.join(root, "CURRENT")
+        if not os.path.exists(current):
+            return None
+        with open(current) as f:
+            snap_dir = os.path.join(root, f.read().strip())
+
+        try:
+            with open(os.path.join(snap_dir, "meta.json")) as f:
+                meta = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Unreadable duplicate snapshot %s: %s", snap_dir, e)
+            return None
+
+        if (meta.get("version") != SNAPSHOT_VERSION or meta.get("bucket_deg") != BUCKET_DEG
+                or meta.get("time_bucket_seconds") != TIME_BUCKET_SECONDS):
+            logger.warning("Ignoring duplicate snapshot with format %s", meta.get("version"))
+            return None
+        if meta.get("model_name") != model_name or (dim is not None and meta.get("count") and meta.get("dim") != dim):
+            logger.warning("Ignoring duplicate snapshot built with %s (dim=%s)", meta.get("model_name"), meta.get("dim"))
+            return None
+
+        arrays = {
+            key: np.load(os.path.join(snap_dir, f"{key}.npy"), mmap_mode="r")
+            for key in ("ids", "coords", "embeddings", "categories", "times", "simhashes", "buckets")
+        }
+        if any(len(arr) != meta["count"] for arr in arrays.values()):
+            logger.warning("Duplicate snapshot %s is inconsistent, ignoring", snap_dir)
+            return None
+
+        index = cls(
+            arrays["ids"], arrays["coords"], arrays["embeddings"], model_name,
+            categories=arrays["categories"], times=arrays["times"], simhashes=arrays["simhashes"],
+            buckets=arrays["buckets"], created_at=meta.get("created_at"),
+        )
+        return index.evicted()
+
+
+def _write_fsync(path, write):
+    with open(path, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+
+def _prune_snapshots(root, keep):
+    snaps = sorted(d for d in os.listdir(root) if d.startswith("snap-") and d != keep)
+    for old in snaps[:max(len(snaps) - (KEEP_SNAPSHOTS - 1), 0)]:
+        shutil.rmtree(os.path.join(root, old), ignore_errors=True)
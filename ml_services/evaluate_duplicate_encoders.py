@@ -0,0 +1,98 @@
+# Offline comparison of duplicate-detection encoders:
+# all-MiniLM-L6-v2 vs pooled embeddings from the fine-tuned DistilBERT severity model.
+#
+# Usage:
+#   python evaluate_duplicate_encoders.py --pairs data/duplicate_pairs.csv
+#
+# The pairs CSV has columns text_a,text_b,is_duplicate (1/0). Without --pairs,
+# every pair of rows in data/data.csv is used with "same category" as a weak
+# proxy label, which is only good for a relative comparison of the encoders.
+import argparse
+import itertools
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import average_precision_score, precision_recall_curve
+
+from duplicate_detection import get_encoder
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_pairs(path=None):
+    if path:
+        pairs = pd.read_csv(path)
+        return pairs["text_a"].astype(str).tolist(), pairs["text_b"].astype(str).tolist(), pairs["is_duplicate"].astype(int).to_numpy()
+
+    print("[WARN] No --pairs given, using same-category pairs from data/data.csv as a proxy label")
+    df = pd.read_csv(os.path.join(script_dir, "data", "data.csv")).dropna(subset=["text", "category"])
+    rows = df.reset_index(drop=True)
+    idx_a, idx_b = zip(*itertools.combinations(range(len(rows)), 2))
+    texts_a = rows["text"].iloc[list(idx_a)].tolist()
+    texts_b = rows["text"].iloc[list(idx_b)].tolist()
+    labels = (rows["category"].iloc[list(idx_a)].to_numpy() == rows["category"].iloc[list(idx_b)].to_numpy()).astype(int)
+    return texts_a, texts_b, labels
+
+
+def evaluate(kind, texts_a, texts_b, labels, threshold):
+    started = time.perf_counter()
+    encoder = get_encoder(kind)
+    load_s = time.perf_counter() - started
+
+    # Encode each distinct text once
+    unique = sorted(set(texts_a) | set(texts_b))
+    started = time.perf_counter()
+    emb = encoder.encode(unique)
+    encode_ms = 1000.0 * (time.perf_counter() - started) / max(len(unique), 1)
+    pos = {t: i for i, t in enumerate(unique)}
+    a = emb[[pos[t] for t in texts_a]]
+    b = emb[[pos[t] for t in texts_b]]
+    sims = np.sum(a * b, axis=1)
+
+    precision, recall, thresholds = precision_recall_curve(labels, sims)
+    f1 = 2 * precision * recall / np.clip(precision + recall, 1e-12, None)
+    best = int(np.argmax(f1[:-1])) if len(thresholds) else 0
+    pred = sims >= threshold
+    tp = int(np.sum(pred & (labels == 1)))
+
+    return {
+        "encoder": encoder.name,
+        "dim": encoder.dim,
+        "load_s": round(load_s, 2),
+        "encode_ms_per_text": round(encode_ms, 2),
+        "average_precision": round(float(average_precision_score(labels, sims)), 4),
+        "best_f1": round(float(f1[best]), 4),
+        "best_f1_threshold": round(float(thresholds[best]), 4) if len(thresholds) else None,
+        "precision_at_best": round(float(precision[best]), 4),
+        "recall_at_best": round(float(recall[best]), 4),
+        f"precision_at_{threshold}": round(tp / max(int(pred.sum()), 1), 4),
+        f"recall_at_{threshold}": round(tp / max(int(labels.sum()), 1), 4),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare duplicate precision/recall of MiniLM vs DistilBERT embeddings")
+    parser.add_argument("--pairs", help="CSV with text_a,text_b,is_duplicate")
+    parser.add_argument("--encoders", default="minilm,distilbert")
+    parser.add_argument("--threshold", type=float, default=0.8, help="cosine threshold to report P/R at")
+    parser.add_argument("--out", help="optional JSON file for the results")
+    args = parser.parse_args()
+
+    texts_a, texts_b, labels = load_pairs(args.pairs)
+    print(f">>> {len(labels)} pairs, {int(labels.sum())} positive")
+
+    results = []
+    for kind in args.encoders.split(","):
+        print(f">>> Evaluating {kind}...")
+        results.append(evaluate(kind.strip(), texts_a, texts_b, labels, args.threshold))
+
+    print("\n=== Duplicate encoder comparison ===")
+    print(pd.DataFrame(results).set_index("encoder").T.to_string())
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n>>> Results written to {args.out}")
@@ -2,7 +2,16 @@ import pandas as pd
 import numpy as np
 from datetime import datetime
 
-def engineer_features_bulk(reports_df, urgency_df=None):
+from geo_index import get_geo_index, GEO_FEATURES
+
+TIME_OF_DAY_BINS = [(6, 12, "morning"), (12, 17, "afternoon"), (17, 21, "evening")]  # everything else is "night"
+
+def engineer_features_bulk(reports_df, urgency_df=None, now=None, in_history=False):
+    """
+    now fixes the reference time for hours_since_report (e.g. one value across training chunks).
+    in_history: the reports are part of the geo index history (training on it), so each
+    report's own entry is left out of historical_issue_count_in_cell.
+    """
     df = reports_df.copy()
     df["report_time"] = pd.to_datetime(df["report_time"], utc=True)
 
@@ -14,25 +23,38 @@ def engineer_features_bulk(reports_df, urgency_df=None):
         df["urgency_score"] = 0.0
 
     df["report_count_log"] = np.log1p(df["report_count"])
-    current_time = pd.Timestamp.utcnow()
+    current_time = pd.Timestamp(now) if now is not None else pd.Timestamp.utcnow()
+    if current_time.tzinfo is None:
+        current_time = current_time.tz_localize("UTC")
     df["hours_since_report"] = (current_time - df["report_time"]).dt.total_seconds() / 3600.0
     df["day_of_week"] = df["report_time"].dt.weekday
     df["is_weekend"] = df["day_of_week"].isin([5,6]).astype(int)
 
-    def map_time_of_day(hour):
-        if 6 <= hour < 12: return "morning"
-        elif 12 <= hour < 17: return "afternoon"
-        elif 17 <= hour < 21: return "evening"
-        else: return "night"
-    df["time_of_day"] = df["report_time"].dt.hour.map(map_time_of_day)
+    hour = df["report_time"].dt.hour.to_numpy()
+    df["time_of_day"] = np.select(
+        [(lo <= hour) & (hour < hi) for lo, hi, _ in TIME_OF_DAY_BINS],
+        [name for _, _, name in TIME_OF_DAY_BINS],
+        default="night",
+    )
 
-    df = pd.get_dummies(df, columns=["category", "time_of_day"], prefix=["cat", "tod"])
+    # Location features come from the precomputed cell index (geo_index.py) when it has been built
+    geo = get_geo_index()
+    if geo is not None and {"lat", "lon"}.issubset(df.columns):
+        categories = df["category"] if "category" in df.columns else None
+        if len(df) == 1:
+            row = df.iloc[0]
+            feats = geo.lookup(row["lat"], row["lon"], categories.iloc[0] if categories is not None else None, in_history)
+            for col in GEO_FEATURES:
+                df[col] = feats[col]
+        else:
+            feats = geo.lookup_bulk(df["lat"].to_numpy(), df["lon"].to_numpy(), categories, in_history)
+            for col in GEO_FEATURES:
+                df[col] = feats[col].to_numpy()
+    else:
+        for col in GEO_FEATURES:
+            df[col] = 0
 
-    df["near_school"] = 0
-    df["near_hospital"] = 0
-    df["historical_issue_count_in_cell"] = 0
-    df["past_dept_response_time_avg"] = 0
-    df["is_peak_traffic_area"] = 0
+    df = pd.get_dummies(df, columns=["category", "time_of_day"], prefix=["cat", "tod"])
 
     return df
 
@@ -43,3 +65,13 @@ def assign_priority(row):
         return "Low"
     else:
         return "Medium"
+
+def assign_priority_bulk(df):
+    """Vectorized assign_priority over a whole feature frame."""
+    urgency = df["urgency_score"].to_numpy()
+    count = df["report_count"].to_numpy()
+    return np.select(
+        [(urgency > 0.7) | (count > 10), (urgency < 0.3) & (count <= 2)],
+        ["High", "Low"],
+        default="Medium",
+    )
@@ -0,0 +1,222 @@
+# Precomputed grid-cell index for the location features of the priority model
+# (near_school, near_hospital, is_peak_traffic_area, historical_issue_count_in_cell,
+# past_dept_response_time_avg). Built offline from local POI and historical-report
+# files, so request time is a cell lookup with no spatial queries.
+#
+# Build:
+#   python geo_index.py --pois data/pois.csv --history data/history.csv --out model/geo_index.npz
+#
+# pois.csv:    lat,lon,type      (type: school, hospital, or a traffic type such as junction)
+# history.csv: lat,lon,category,report_time[,resolved_time]
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+GEO_CELL_DEG = 0.005        # ~550m cells
+POI_RADIUS_M = 500          # "near" means a POI within roughly this distance
+TRAFFIC_POI_TYPES = {"traffic", "junction", "signal", "bus_stop", "market", "metro_station"}
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+GEO_INDEX_PATH = os.getenv("GEO_INDEX_PATH", os.path.join(script_dir, "model", "geo_index.npz"))
+
+GEO_FEATURES = [
+    "near_school",
+    "near_hospital",
+    "historical_issue_count_in_cell",
+    "past_dept_response_time_avg",
+    "is_peak_traffic_area",
+]
+
+_CELL_OFFSET = 1 << 20
+_CELL_STRIDE = 1 << 21
+
+
+# === Cells ===
+def cell_keys(lats, lons, cell_deg=GEO_CELL_DEG):
+    lat_idx = np.floor(np.asarray(lats, dtype=np.float64) / cell_deg).astype(np.int64)
+    lon_idx = np.floor(np.asarray(lons, dtype=np.float64) / cell_deg).astype(np.int64)
+    return (lat_idx + _CELL_OFFSET) * _CELL_STRIDE + (lon_idx + _CELL_OFFSET)
+
+def _cells_within(lat, lon, radius_m, cell_deg):
+    """Keys of all cells whose extent intersects the bounding box of radius_m around a point."""
+    dlat = radius_m / 111320.0
+    dlon = radius_m / (111320.0 * max(np.cos(np.radians(lat)), 0.01))
+    lat_range = np.arange(np.floor((lat - dlat) / cell_deg), np.floor((lat + dlat) / cell_deg) + 1, dtype=np.int64)
+    lon_range = np.arange(np.floor((lon - dlon) / cell_deg), np.floor((lon + dlon) / cell_deg) + 1, dtype=np.int64)
+    return ((lat_range[:, None] + _CELL_OFFSET) * _CELL_STRIDE + (lon_range[None, :] + _CELL_OFFSET)).ravel()
+
+
+# === Builder ===
+def build_geo_index(pois, history, out_path=GEO_INDEX_PATH, cell_deg=GEO_CELL_DEG, radius_m=POI_RADIUS_M):
+    pois = pois.dropna(subset=["lat", "lon", "type"]) if pois is not None else pd.DataFrame(columns=["lat", "lon", "type"])
+    history = history.dropna(subset=["lat", "lon"]) if history is not None else pd.DataFrame(columns=["lat", "lon", "category", "report_time"])
+    poi_type = pois["type"].astype(str).str.lower()
+
+    def dilate(mask):
+        cells = [_cells_within(lat, lon, radius_m, cell_deg) for lat, lon in pois.loc[mask, ["lat", "lon"]].to_numpy()]
+        return np.unique(np.concatenate(cells)) if cells else np.empty(0, dtype=np.int64)
+
+    school_cells = dilate(poi_type == "school")
+    hospital_cells = dilate(poi_type == "hospital")
+    traffic_cells = dilate(poi_type.isin(TRAFFIC_POI_TYPES))
+
+    hist_cells = cell_keys(history["lat"], history["lon"], cell_deg)
+    count_cells, counts = np.unique(hist_cells, return_counts=True)
+
+    cells = np.unique(np.concatenate([school_cells, hospital_cells, traffic_cells, count_cells]))
+    issue_count = np.zeros(len(cells), dtype=np.int32)
+    issue_count[np.searchsorted(cells, count_cells)] = counts
+
+    # Response time (hours) per (cell, category), with per-category and global fallbacks
+    # astype(str) keeps NaN as a float under pandas 3, so blank it first; "" means unknown category
+    hist_cat = history["category"].fillna("").astype(str).str.lower() if "category" in history else pd.Series("", index=history.index)
+    categories = np.array(sorted(c for c in hist_cat.unique() if c), dtype=str)
+    resp_keys = np.empty(0, dtype=np.int64)
+    resp_hours = np.empty(0, dtype=np.float32)
+    cat_hours = np.full(len(categories), np.nan, dtype=np.float32)
+    global_hours = 0.0
+    if "resolved_time" in history.columns and len(categories):
+        opened = pd.to_datetime(history["report_time"], utc=True, errors="coerce")
+        closed = pd.to_datetime(history["resolved_time"], utc=True, errors="coerce")
+        hours = ((closed - opened).dt.total_seconds() / 3600.0).to_numpy()
+        cat_str = hist_cat.to_numpy(dtype=str)
+        cat_codes = np.clip(np.searchsorted(categories, cat_str), 0, len(categories) - 1)
+        ok = ~np.isnan(hours) & (hours >= 0) & (categories[cat_codes] == cat_str)
+        if ok.any():
+            resp = pd.DataFrame({"key": hist_cells[ok] * len(categories) + cat_codes[ok], "cat": cat_codes[ok], "hours": hours[ok]})
+            per_key = resp.groupby("key")["hours"].mean()
+            resp_keys = per_key.index.to_numpy(dtype=np.int64)
+            resp_hours = per_key.to_numpy(dtype=np.float32)
+            per_cat = resp.groupby("cat")["hours"].mean()
+            cat_hours[per_cat.index.to_numpy()] = per_cat.to_numpy()
+            global_hours = float(resp["hours"].mean())
+    cat_hours = np.where(np.isnan(cat_hours), global_hours, cat_hours).astype(np.float32)
+
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    tmp_path = out_path + ".tmp.npz"
+    np.savez(
+        tmp_path,
+        cells=cells,
+        near_school=np.isin(cells, school_cells).astype(np.uint8),
+        near_hospital=np.isin(cells, hospital_cells).astype(np.uint8),
+        is_peak_traffic_area=np.isin(cells, traffic_cells).astype(np.uint8),
+        issue_count=issue_count,
+        categories=categories,
+        resp_keys=resp_keys,
+        resp_hours=resp_hours,
+        cat_hours=cat_hours,
+        meta=np.array([cell_deg, radius_m, global_hours, time.time()], dtype=np.float64),
+    )
+    os.replace(tmp_path, out_path)
+    return GeoIndex.load(out_path)
+
+
+# === Index ===
+class GeoIndex:
+    def __init__(self, arrays):
+        self.cells = arrays["cells"]
+        self.near_school = arrays["near_school"]
+        self.near_hospital = arrays["near_hospital"]
+        self.is_peak_traffic_area = arrays["is_peak_traffic_area"]
+        self.issue_count = arrays["issue_count"]
+        self.categories = arrays["categories"]
+        self.resp_keys = arrays["resp_keys"]
+        self.resp_hours = arrays["resp_hours"]
+        self.cat_hours = arrays["cat_hours"]
+        self.cell_deg, self.radius_m, self.global_hours, self.built_at = arrays["meta"].tolist()
+        # O(1) path for single-report requests
+        self._cell_row = {int(c): i for i, c in enumerate(self.cells.tolist())}
+        self._cat_code = {str(c): i for i, c in enumerate(self.categories.tolist())}
+        self._resp = dict(zip(self.resp_keys.tolist(), self.resp_hours.tolist()))
+
+    @classmethod
+    def load(cls, path=GEO_INDEX_PATH):
+        with np.load(path) as data:
+            return cls({key: data[key] for key in data.files})
+
+    def _response_hours(self, cell, category):
+        code = None if category is None or pd.isna(category) else self._cat_code.get(str(category).lower())
+        if code is None:
+            return self.global_hours
+        return self._resp.get(cell * len(self.categories) + code, float(self.cat_hours[code]))
+
+    def lookup(self, lat, lon, category=None, in_history=False):
+        """
+        Features of a single report as a dict. in_history: the report itself is one of the
+        historical reports the index was built from (e.g. training rows), so it is not
+        counted in its own historical_issue_count_in_cell.
+        """
+        cell = int(cell_keys([lat], [lon], self.cell_deg)[0])
+        row = self._cell_row.get(cell)
+        return {
+            "near_school": int(self.near_school[row]) if row is not None else 0,
+            "near_hospital": int(self.near_hospital[row]) if row is not None else 0,
+            "historical_issue_count_in_cell": max(int(self.issue_count[row]) - bool(in_history), 0) if row is not None else 0,
+            "past_dept_response_time_avg": self._response_hours(cell, category),
+            "is_peak_traffic_area": int(self.is_peak_traffic_area[row]) if row is not None else 0,
+        }
+
+    def lookup_bulk(self, lats, lons, categories=None, in_history=False):
+        """
+        Vectorized features for many reports as a DataFrame with GEO_FEATURES columns.
+        in_history: bool or per-row bool array, as in lookup().
+        """
+        cells = cell_keys(lats, lons, self.cell_deg)
+        n = len(cells)
+
+        pos = np.clip(np.searchsorted(self.cells, cells), 0, max(len(self.cells) - 1, 0))
+        found = (self.cells[pos] == cells) if len(self.cells) else np.zeros(n, dtype=bool)
+
+        def take(arr):
+            return np.where(found, arr[pos] if len(arr) else 0, 0)
+
+        hours = np.full(n, self.global_hours, dtype=np.float64)
+        if categories is not None and len(self.categories):
+            cats = pd.Series(categories).fillna("").astype(str).str.lower().to_numpy(dtype=str)
+            code = np.searchsorted(self.categories, cats)
+            code = np.clip(code, 0, len(self.categories) - 1)
+            known = (self.categories[code] == cats) & (cats != "")
+            hours = np.where(known, self.cat_hours[code], hours)
+            if len(self.resp_keys):
+                keys = cells * len(self.categories) + code
+                rpos = np.clip(np.searchsorted(self.resp_keys, keys), 0, len(self.resp_keys) - 1)
+                hit = known & (self.resp_keys[rpos] == keys)
+                hours = np.where(hit, self.resp_hours[rpos], hours)
+
+        return pd.DataFrame({
+            "near_school": take(self.near_school).astype(int),
+            "near_hospital": take(self.near_hospital).astype(int),
+            "historical_issue_count_in_cell": np.maximum(take(self.issue_count).astype(int) - np.asarray(in_history, dtype=int), 0),
+            "past_dept_response_time_avg": hours,
+            "is_peak_traffic_area": take(self.is_peak_traffic_area).astype(int),
+        })
+
+
+_GEO_INDEX = None
+
+def get_geo_index():
+    """Lazily loaded index from GEO_INDEX_PATH, or None if it has not been built."""
+    global _GEO_INDEX
+    if _GEO_INDEX is None and os.path.exists(GEO_INDEX_PATH):
+        _GEO_INDEX = GeoIndex.load(GEO_INDEX_PATH)
+        print(f"Loaded geo feature index ({len(_GEO_INDEX.cells)} cells).")
+    return _GEO_INDEX
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the grid-cell feature index for the priority model")
+    parser.add_argument("--pois", help="CSV with lat,lon,type")
+    parser.add_argument("--history", help="CSV with lat,lon,category,report_time[,resolved_time]")
+    parser.add_argument("--out", default=GEO_INDEX_PATH)
+    parser.add_argument("--cell-deg", type=float, default=GEO_CELL_DEG)
+    parser.add_argument("--radius-m", type=float, default=POI_RADIUS_M)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    pois = pd.read_csv(args.pois) if args.pois else None
+    history = pd.read_csv(args.history) if args.history else None
+    index = build_geo_index(pois, history, args.out, args.cell_deg, args.radius_m)
+    print(f">>> Geo index with {len(index.cells)} cells written to {args.out} in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,234 @@
+# Online incident clustering: every report joins the nearest open incident of the same
+# category (within a radius and time gap, optionally above an embedding similarity) or
+# starts a new one. Maintains per-incident report_count, centroid and first/last-seen
+# times for feature engineering, in O(candidate incidents) per report.
+#
+# Consistency check against a batch haversine DBSCAN:
+#   python incident_clustering.py --reports reports.csv
+#   reports.csv: id,lat,lon,category,report_time
+import argparse
+import heapq
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from duplicate_index import EARTH_RADIUS_M, bucket_keys, haversine_np, neighbour_keys
+
+CLUSTER_RADIUS_M = 100
+CLUSTER_GAP_SECONDS = 14 * 24 * 3600   # an incident quiet for longer than this is closed
+CLUSTER_MIN_SIMILARITY = 0.5           # only applied when both sides have embeddings
+
+
+class IncidentClusterer:
+    """
+    Thread-safe: the API's threadpool endpoints share one instance, so every public
+    method holds self.lock. Callers that read clusters after assign() hold it too.
+    Incidents quiet for longer than gap_seconds (relative to the newest report seen)
+    are closed and dropped together with their report ids, so memory stays bounded
+    by the reports inside the gap.
+    """
+    def __init__(self, radius_m=CLUSTER_RADIUS_M, gap_seconds=CLUSTER_GAP_SECONDS, min_similarity=CLUSTER_MIN_SIMILARITY):
+        self.radius_m = radius_m
+        self.gap_seconds = gap_seconds
+        self.min_similarity = min_similarity
+        self.clusters = {}         # cluster_id -> dict, open incidents only
+        self.report_cluster = {}   # report id -> cluster_id
+        self.lock = threading.RLock()
+        self._cells = {}           # spatial bucket -> set of cluster ids
+        self._next_id = 0
+        self._latest = -np.inf     # newest report time seen
+        self._expiry = []          # heap of (last_seen, cluster_id), entries go stale on update
+
+    def __len__(self):
+        return len(self.clusters)
+
+    def _cell(self, lat, lon):
+        return int(bucket_keys([lat], [lon])[0])
+
+    def _candidates(self, lat, lon):
+        ids = set()
+        for key in neighbour_keys(lat, lon, self.radius_m).tolist():
+            ids.update(self._cells.get(key, ()))
+        return list(ids)
+
+    def assign(self, report_id, lat, lon, category=None, report_time=None, embedding=None):
+        """Add a report and return its cluster_id. Re-assigning a known id is a no-op."""
+        report_id = str(report_id)
+        now = report_time if report_time is not None else time.time()
+        # NaN (e.g. a missing category in a synced DataFrame) counts as unknown, like ""
+        category = None if category is None or pd.isna(category) or category == "" else str(category).lower()
+        if embedding is not None:
+            embedding = np.asarray(embedding, dtype=np.float32)
+
+        with self.lock:
+            if report_id in self.report_cluster:
+                return self.report_cluster[report_id]
+            self._latest = max(self._latest, now)
+            self._evict()
+
+            best, best_dist = None, None
+            candidates = self._candidates(lat, lon)
+            if candidates:
+                lats = np.array([self.clusters[c]["lat"] for c in candidates])
+                lons = np.array([self.clusters[c]["lon"] for c in candidates])
+                dists = haversine_np(lat, lon, lats, lons)
+                for cid, dist in zip(candidates, dists.tolist()):
+                    cluster = self.clusters[cid]
+                    if dist > self.radius_m or now - cluster["last_seen"] > self.gap_seconds:
+                        continue
+                    if category and cluster["category"] and cluster["category"] != category:
+                        continue
+                    if embedding is not None and cluster["embedding"] is not None:
+                        if float(cluster["embedding"] @ embedding) < self.min_similarity:
+                            continue
+                    if best is None or dist < best_dist:
+                        best, best_dist = cid, dist
+
+            if best is None:
+                best = self._next_id
+                self._next_id += 1
+                self.clusters[best] = {
+                    "lat": float(lat), "lon": float(lon), "category": category,
+                    "report_count": 1, "first_seen": now, "last_seen": now,
+                    "embedding": embedding, "cell": self._cell(lat, lon), "reports": [],
+                }
+                self._cells.setdefault(self.clusters[best]["cell"], set()).add(best)
+            else:
+                self._update(best, lat, lon, category, now, embedding)
+
+            cluster = self.clusters[best]
+            cluster["reports"].append(report_id)
+            self.report_cluster[report_id] = best
+            heapq.heappush(self._expiry, (cluster["last_seen"], best))
+            return best
+
+    def _update(self, cid, lat, lon, category, now, embedding):
+        cluster = self.clusters[cid]
+        n = cluster["report_count"] + 1
+        # running-mean centroid
+        cluster["lat"] += (lat - cluster["lat"]) / n
+        cluster["lon"] += (lon - cluster["lon"]) / n
+        cluster["report_count"] = n
+        cluster["first_seen"] = min(cluster["first_seen"], now)
+        cluster["last_seen"] = max(cluster["last_seen"], now)
+        cluster["category"] = cluster["category"] or category
+        if embedding is not None:
+            emb = embedding if cluster["embedding"] is None else cluster["embedding"] + (embedding - cluster["embedding"]) / n
+            cluster["embedding"] = emb / max(np.linalg.norm(emb), 1e-12)
+
+        cell = self._cell(cluster["lat"], cluster["lon"])
+        if cell != cluster["cell"]:
+            self._cells[cluster["cell"]].discard(cid)
+            self._cells.setdefault(cell, set()).add(cid)
+            cluster["cell"] = cell
+
+    def _evict(self):
+        """Drop incidents whose last report is more than gap_seconds older than the newest one."""
+        cutoff = self._latest - self.gap_seconds
+        while self._expiry and self._expiry[0][0] < cutoff:
+            last_seen, cid = heapq.heappop(self._expiry)
+            cluster = self.clusters.get(cid)
+            if cluster is None or cluster["last_seen"] != last_seen:
+                continue  # already evicted, or updated since (a newer heap entry exists)
+            cell = self._cells.get(cluster["cell"])
+            cell.discard(cid)
+            if not cell:
+                del self._cells[cluster["cell"]]
+            for report_id in cluster["reports"]:
+                self.report_cluster.pop(report_id, None)
+            del self.clusters[cid]
+
+    def closed_before(self, newest=None):
+        """
+        Report time before which incidents are closed, also counting a batch whose newest
+        report is newest. Feeding an older report only opens an incident that is closed
+        again on the next assign(), so callers re-syncing reports skip those.
+        """
+        with self.lock:
+            return max(self._latest, -np.inf if newest is None else newest) - self.gap_seconds
+
+    def report_count(self, report_id):
+        """Size of the incident a report belongs to (1 for unknown or closed incidents)."""
+        with self.lock:
+            cid = self.report_cluster.get(str(report_id))
+            return self.clusters[cid]["report_count"] if cid is not None else 1
+
+    def to_frame(self):
+        """One row per open incident: cluster_id, lat, lon, category, report_count, first_seen, last_seen."""
+        with self.lock:
+            return pd.DataFrame([
+                {"cluster_id": cid, **{k: c[k] for k in ("lat", "lon", "category", "report_count", "first_seen", "last_seen")}}
+                for cid, c in self.clusters.items()
+            ], columns=["cluster_id", "lat", "lon", "category", "report_count", "first_seen", "last_seen"])
+
+    def report_features(self, report_ids):
+        """id, cluster_id, report_count for the given reports, ready to merge into engineer_features_bulk input."""
+        with self.lock:
+            cids = [self.report_cluster.get(str(r)) for r in report_ids]
+            return pd.DataFrame({
+                "id": list(report_ids),
+                "cluster_id": cids,
+                "report_count": [self.clusters[c]["report_count"] if c is not None else 1 for c in cids],
+            })
+
+
+# === Batch re-clustering ===
+def _epoch_seconds(values):
+    times = pd.to_datetime(values, utc=True, errors="coerce")
+    return (times - pd.Timestamp(0, tz="UTC")).dt.total_seconds().to_numpy()
+
+def cluster_online(reports_df, **kwargs):
+    """Replay reports in time order through an IncidentClusterer, returning it and per-row labels."""
+    df = reports_df.assign(ts=_epoch_seconds(reports_df["report_time"])).sort_values("ts")
+    clusterer = IncidentClusterer(**kwargs)
+    assigned = {}  # kept here because closed incidents are dropped from the clusterer
+    for row in df.itertuples(index=False):
+        assigned[str(row.id)] = clusterer.assign(row.id, row.lat, row.lon, getattr(row, "category", None), row.ts)
+    labels = np.array([assigned[str(i)] for i in reports_df["id"]])
+    return clusterer, labels
+
+def recluster_dbscan(reports_df, radius_m=CLUSTER_RADIUS_M):
+    """Batch haversine DBSCAN per category; every report gets a label (min_samples=1)."""
+    from sklearn.cluster import DBSCAN
+
+    labels = np.full(len(reports_df), -1, dtype=np.int64)
+    categories = reports_df["category"].fillna("").astype(str).str.lower() if "category" in reports_df else pd.Series([""] * len(reports_df))
+    offset = 0
+    for _, idx in reports_df.groupby(categories.to_numpy()).indices.items():
+        coords = np.radians(reports_df[["lat", "lon"]].to_numpy(dtype=np.float64)[idx])
+        db = DBSCAN(eps=radius_m / EARTH_RADIUS_M, min_samples=1, metric="haversine", algorithm="ball_tree").fit(coords)
+        labels[idx] = db.labels_ + offset
+        offset += db.labels_.max() + 1
+    return labels
+
+def consistency_report(reports_df, radius_m=CLUSTER_RADIUS_M):
+    from sklearn.metrics import adjusted_rand_score
+
+    started = time.perf_counter()
+    clusterer, online = cluster_online(reports_df, radius_m=radius_m, gap_seconds=float("inf"))
+    online_s = time.perf_counter() - started
+    started = time.perf_counter()
+    batch = recluster_dbscan(reports_df, radius_m)
+    batch_s = time.perf_counter() - started
+    return {
+        "reports": len(reports_df),
+        "online_clusters": len(clusterer),
+        "dbscan_clusters": int(len(np.unique(batch))),
+        "adjusted_rand_index": float(adjusted_rand_score(batch, online)),
+        "online_us_per_report": 1e6 * online_s / max(len(reports_df), 1),
+        "dbscan_s": batch_s,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare online incident clustering with batch haversine DBSCAN")
+    parser.add_argument("--reports", required=True, help="CSV with id,lat,lon,category,report_time")
+    parser.add_argument("--radius-m", type=float, default=CLUSTER_RADIUS_M)
+    args = parser.parse_args()
+
+    reports = pd.read_csv(args.reports).dropna(subset=["lat", "lon"]).reset_index(drop=True)
+    print("\n=== Online vs DBSCAN clustering ===")
+    for key, value in consistency_report(reports, args.radius_m).items():
+        print(f"{key}: {value}")
@@ -1,5 +1,6 @@
 import torch
 import os
+import hashlib
 import numpy as np
 from transformers import DistilBertTokenizerFast
 from train_multitask_distilbert import DistilBertMultiTask
@@ -11,27 +12,67 @@ DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 script_dir = os.path.dirname(os.path.abspath(__file__))
 OUTPUT_DIR = os.path.join(script_dir, "output_distilbert_multitask")
 
-# Load saved checkpoint and tokenizer
-ckpt = torch.load(os.path.join(OUTPUT_DIR, "best_model.pth"), map_location=DEVICE)
-tokenizer = DistilBertTokenizerFast.from_pretrained(os.path.join(OUTPUT_DIR, "tokenizer"))
-cat_classes = ckpt["cat_le_classes"]
-urg_classes = ckpt["urg_le_classes"]
-
-# Initialize model
-model = DistilBertMultiTask(MODEL_NAME, num_cat=len(cat_classes), num_urg=len(urg_classes))
-model.load_state_dict(ckpt["model_state_dict"])
-model.to(DEVICE)
-model.eval()
-
-def predict_text(text):
-    enc = tokenizer(
-        text, max_length=128, truncation=True, padding="max_length", return_tensors="pt"
-    )
-    input_ids = enc["input_ids"].to(DEVICE)
-    attention_mask = enc["attention_mask"].to(DEVICE)
+CHECKPOINT_PATH = os.path.join(OUTPUT_DIR, "best_model.pth")
+
+def checkpoint_version(path=CHECKPOINT_PATH):
+    """Cheap identity of a checkpoint file (size + mtime), changes whenever it is replaced."""
+    st = os.stat(path)
+    return hashlib.sha1(f"{st.st_size}:{st.st_mtime_ns}".encode()).hexdigest()[:12]
+
+class SeverityModel:
+    """A loaded checkpoint: model, tokenizer, label classes and version, swapped as one unit."""
+    def __init__(self, checkpoint_path=CHECKPOINT_PATH, tokenizer_dir=os.path.join(OUTPUT_DIR, "tokenizer")):
+        # version first: if the file is replaced while loading, the next reload sees a new version
+        self.version = checkpoint_version(checkpoint_path)
+        ckpt = torch.load(checkpoint_path, map_location=DEVICE)
+        self.tokenizer = DistilBertTokenizerFast.from_pretrained(tokenizer_dir)
+        self.cat_classes = ckpt["cat_le_classes"]
+        self.urg_classes = ckpt["urg_le_classes"]
+        self.model = DistilBertMultiTask(MODEL_NAME, num_cat=len(self.cat_classes), num_urg=len(self.urg_classes))
+        self.model.load_state_dict(ckpt["model_state_dict"])
+        self.model.to(DEVICE)
+        self.model.eval()
+
+    def encode(self, texts, padding="max_length"):
+        enc = self.tokenizer(
+            texts, max_length=128, truncation=True, padding=padding, return_tensors="pt"
+        )
+        return enc["input_ids"].to(DEVICE), enc["attention_mask"].to(DEVICE)
+
+    def warmup(self, texts=("Pothole on the main road near the school", "Garbage not collected for a week")):
+        """Run a forward pass so the first real request does not pay for lazy init."""
+        input_ids, attention_mask = self.encode(list(texts), padding=True)
+        with torch.no_grad():
+            self.model(input_ids=input_ids, attention_mask=attention_mask, return_embedding=True)
+
+def activate(bundle):
+    """Make bundle the model behind predict_text/embed_texts. Calls already running keep the old one."""
+    global _active, model, tokenizer, cat_classes, urg_classes, MODEL_VERSION, EMBEDDING_MODEL_NAME
+    _active = bundle
+    model, tokenizer = bundle.model, bundle.tokenizer
+    cat_classes, urg_classes = bundle.cat_classes, bundle.urg_classes
+    MODEL_VERSION = bundle.version
+    # Name under which pooled DistilBERT embeddings are stored in the duplicate index
+    EMBEDDING_MODEL_NAME = f"distilbert-multitask:{MODEL_VERSION}"
+
+def active_model():
+    return _active
+
+# Load saved checkpoint and tokenizer (model_manager.py swaps in newer checkpoints later)
+activate(SeverityModel())
+
+def predict_text(text, return_embedding=False, bundle=None):
+    """
+    Category/urgency prediction. With return_embedding=True the result also carries
+    "embedding": an L2-normalised mean-pooled sentence vector (np.float32) from the same pass.
+    bundle: the SeverityModel to use, so callers can report its version; defaults to the active one.
+    """
+    bundle = bundle if bundle is not None else _active  # one consistent model for the whole call, even across a swap
+    input_ids, attention_mask = bundle.encode(text)
 
     with torch.no_grad():
-        cat_logits, urg_logits = model(input_ids=input_ids, attention_mask=attention_mask)
+        outputs = bundle.model(input_ids=input_ids, attention_mask=attention_mask, return_embedding=return_embedding)
+    cat_logits, urg_logits = outputs[0], outputs[1]
 
     cat_pred = torch.argmax(cat_logits, dim=1).cpu().item()
     urg_pred = torch.argmax(urg_logits, dim=1).cpu().item()
@@ -39,12 +80,52 @@ def predict_text(text):
     cat_prob = torch.softmax(cat_logits, dim=1)[0].cpu().numpy().tolist()
     urg_prob = torch.softmax(urg_logits, dim=1)[0].cpu().numpy().tolist()
 
-    return {
-        "category": cat_classes[cat_pred],
-        "category_probs": {cls: float(p) for cls, p in zip(cat_classes, cat_prob)},
-        "urgency": urg_classes[urg_pred],
-        "urgency_probs": {cls: float(p) for cls, p in zip(urg_classes, urg_prob)}
+    result = {
+        "category": bundle.cat_classes[cat_pred],
+        "category_probs": {cls: float(p) for cls, p in zip(bundle.cat_classes, cat_prob)},
+        "urgency": bundle.urg_classes[urg_pred],
+        "urgency_probs": {cls: float(p) for cls, p in zip(bundle.urg_classes, urg_prob)}
     }
+    if return_embedding:
+        result["embedding"] = _normalize(outputs[2])[0]
+    return result
+
+def predict_batch(texts, batch_size=32):
+    """predict_text for many texts, batch_size per forward pass (padded to the longest in each batch)."""
+    bundle = _active
+    results = []
+    for i in range(0, len(texts), batch_size):
+        input_ids, attention_mask = bundle.encode([str(t) for t in texts[i:i + batch_size]], padding=True)
+        with torch.no_grad():
+            cat_logits, urg_logits = bundle.model(input_ids=input_ids, attention_mask=attention_mask)
+        cat_probs = torch.softmax(cat_logits, dim=1).cpu().numpy()
+        urg_probs = torch.softmax(urg_logits, dim=1).cpu().numpy()
+        for cat_prob, urg_prob in zip(cat_probs, urg_probs):
+            results.append({
+                "category": bundle.cat_classes[int(cat_prob.argmax())],
+                "category_probs": {cls: float(p) for cls, p in zip(bundle.cat_classes, cat_prob)},
+                "urgency": bundle.urg_classes[int(urg_prob.argmax())],
+                "urgency_probs": {cls: float(p) for cls, p in zip(bundle.urg_classes, urg_prob)}
+            })
+    return results
+
+def embed_texts(texts, batch_size=32):
+    """L2-normalised pooled DistilBERT embeddings, shape (len(texts), hidden_size)."""
+    bundle = _active
+    chunks = []
+    for i in range(0, len(texts), batch_size):
+        # pad to the longest text in the batch, the pooled vector ignores padding anyway
+        input_ids, attention_mask = bundle.encode([str(t) for t in texts[i:i + batch_size]], padding=True)
+        with torch.no_grad():
+            _, _, pooled = bundle.model(input_ids=input_ids, attention_mask=attention_mask, return_embedding=True)
+        chunks.append(_normalize(pooled))
+    if not chunks:
+        return np.zeros((0, bundle.model.backbone.config.hidden_size), dtype=np.float32)
+    return np.vstack(chunks)
+
+def _normalize(pooled):
+    emb = torch.nn.functional.normalize(pooled, p=2, dim=1)
+    return emb.cpu().numpy().astype(np.float32)
 
 # Quick test
 if __name__ == "__main__":
@@ -1,17 +1,26 @@
 from fastapi import FastAPI, HTTPException, Request, Security
 from pydantic import BaseModel
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional
 import uvicorn
 from fastapi.security.api_key import APIKeyHeader
 from fastapi import status
 
-from inference import predict_text
+from cascade import predict_versioned, cascade_stats, model_version  # DistilBERT, optionally behind the linear cascade
+from severity_cache import severity_cache
 from feature_engineering import engineer_features_bulk, assign_priority
-from duplicate_detection import DuplicateDetector
+from duplicate_detection import DuplicateDetector, DUPLICATE_ENCODER, DUPLICATE_SCORE_THRESHOLD, duplicate_stats
+from model_manager import ModelManager
+from wire import NegotiatedResponse, NegotiatedRoute, ndjson_response
+import profiling
+from profiling import profiled
+from fastapi.responses import FileResponse
+import inference
 import pickle
 import os
 
-app = FastAPI()
+# JSON (orjson when installed) or MessagePack, per Content-Type / Accept
+app = FastAPI(default_response_class=NegotiatedResponse)
+app.router.route_class = NegotiatedRoute
 
 # Load CatBoost priority model and columns
 PRIORITY_MODEL_PATH = os.path.join(os.path.dirname(__file__), 'model', 'priority_model.pkl')
@@ -24,12 +33,32 @@ def load_priority_model():
         columns = pickle.load(f)
     return model, columns
 
-priority_model, priority_columns = load_priority_model()
+# Sample report used to warm up a freshly loaded priority model before it is swapped in
+WARMUP_FEATURES = {"id": 0, "category": "pothole", "report_count": 3, "lat": 28.61, "lon": 77.23, "report_time": "2025-09-10 14:30:00"}
+
+def warm_priority_model(loaded):
+    import pandas as pd
+    model, columns = loaded
+    names = getattr(model, "feature_names_", None)
+    if names is not None and list(names) != list(columns):
+        # priority_train.py replaces the columns file before the model; wait for the matching model
+        raise ValueError("priority model and columns files are from different training runs")
+    features = engineer_features_bulk(pd.DataFrame([WARMUP_FEATURES]))
+    model.predict(features.reindex(columns=columns, fill_value=0))
+
+# Models are swapped atomically on reload; handlers read model and version once per request via models.get_versioned()
+models = ModelManager()
+models.register("priority", [PRIORITY_MODEL_PATH, PRIORITY_COLUMNS_PATH], load_priority_model, warmup=warm_priority_model)
+models.register("severity", [inference.CHECKPOINT_PATH], inference.SeverityModel,
+                warmup=lambda bundle: bundle.warmup(), activate=inference.activate, initial=inference.active_model())
 
 # Request/response schemas
 class SeverityRequest(BaseModel):
     text: str
 
+class SeverityBatchRequest(BaseModel):
+    texts: List[str]
+
 class PriorityRequest(BaseModel):
     features: Dict[str, Any]
 
@@ -40,7 +69,8 @@ class DuplicateRequest(BaseModel):
     lat: float
     lon: float
     text: str
-    existing_reports: list  # List of dicts with keys: id, lat, lon, text
+    category: Optional[str] = None
+    existing_reports: list  # List of dicts with keys: id, lat, lon, text (optional: category, status, created_at)
 
 # Middleware for API key authentication
 # For local development: if ML_API_KEY is not set, API key validation is disabled
@@ -77,6 +107,9 @@ async def api_key_middleware(request: Request, call_next):
         )
     return await call_next(request)
 
+# Opt-in profiling: "X-Profile: 1" or the sampling rate from /admin/profiling
+app.add_middleware(profiling.ProfilingMiddleware)
+
 @app.on_event("startup")
 async def startup_event():
     if not REQUIRE_API_KEY:
@@ -86,6 +119,7 @@ async def startup_event():
         print("=" * 60)
     else:
         print("✓ API key validation is enabled")
+    models.start_watcher()
 
 @app.get("/")
 def read_root():
@@ -95,15 +129,63 @@ def read_root():
         "api_key_required": REQUIRE_API_KEY
     }
 
+@app.get("/metrics")
+def metrics():
+    return {
+        "duplicate": duplicate_stats(),
+        "severity_cascade": cascade_stats(),
+        "severity_cache": severity_cache.metrics(),
+        "models": models.status(),
+    }
+
+@app.post("/admin/reload_models")
+def reload_models(name: Optional[str] = None, force: bool = False):
+    """Reload changed model files in the background (all models, or just `name`)."""
+    if name is not None and name not in models.slots:
+        raise HTTPException(status_code=404, detail=f"Unknown model '{name}'")
+    return {"reloading": models.reload_async(name, force=force), "models": models.status()}
+
+@app.post("/admin/profiling")
+def set_profiling(sample_rate: float):
+    """Profile this fraction of requests (0 disables sampling; X-Profile: 1 always works)."""
+    return {"sample_rate": profiling.set_sample_rate(sample_rate)}
+
+@app.get("/profiles")
+def profiles():
+    return {"sample_rate": profiling.sample_rate(), "profiles": profiling.list_profiles()}
+
+@app.get("/profiles/{profile_id}/{filename}")
+def download_profile(profile_id: str, filename: str):
+    path = profiling.profile_path(profile_id, filename)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, filename=f"{profile_id}-{filename}")
+
 @app.post("/predict_severity")
+@profiled
 def predict_severity(req: SeverityRequest):
     try:
-        result = predict_text(req.text)
-        return {"severity": result}
+        result, version = severity_cache.get_or_compute(req.text, model_version(), predict_versioned)
+        return {"severity": result, "model_version": version}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/predict_severity_batch")
+def predict_severity_batch(req: SeverityBatchRequest):
+    """NDJSON stream, one {"index", "severity", "model_version"} line per text as soon as it is scored."""
+    def rows():
+        for i, text in enumerate(req.texts):
+            try:
+                # per line: a model swapped in mid-stream answers (and is reported for) the rest
+                result, version = severity_cache.get_or_compute(text, model_version(), predict_versioned)
+                yield {"index": i, "severity": result, "model_version": version}
+            except Exception as e:
+                yield {"index": i, "error": str(e)}
+
+    return ndjson_response(rows())
+
 @app.post("/predict_priority")
+@profiled
 def predict_priority(req: PriorityRequest):
     try:
         import pandas as pd
@@ -119,12 +201,13 @@ def predict_priority(req: PriorityRequest):
         print(f"Processed features columns: {list(features_processed.columns)}")
         
         # Select only the columns that the model was trained on
+        (priority_model, priority_columns), version = models.get_versioned("priority")
         features_final = features_processed.reindex(columns=priority_columns, fill_value=0)
         print(f"Final features shape: {features_final.shape}")
         
         pred = priority_model.predict(features_final)[0]
         print(f"Prediction: {pred}")
-        return {"priority": pred}  # Return as string, not int
+        return {"priority": pred, "model_version": version}  # Return as string, not int
     except Exception as e:
         print(f"Error in predict_priority: {str(e)}")
         import traceback
@@ -132,6 +215,7 @@ def predict_priority(req: PriorityRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/route_report")
+@profiled
 def route_report(req: RouteReportRequest):
     try:
         import pandas as pd
@@ -140,6 +224,7 @@ def route_report(req: RouteReportRequest):
         features_processed = engineer_features_bulk(features_df)
         
         # Select only the columns that the model was trained on
+        (priority_model, priority_columns), version = models.get_versioned("priority")
         features_final = features_processed.reindex(columns=priority_columns, fill_value=0)
         
         priority = priority_model.predict(features_final)[0]
@@ -147,20 +232,39 @@ def route_report(req: RouteReportRequest):
         # Use the first row of features_processed to assign department
         department = assign_priority(features_processed.iloc[0])
         
-        return {"priority": priority, "department": department}  # Return priority as string
+        return {"priority": priority, "department": department, "model_version": version}  # Return priority as string
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/detect_duplicate")
+@profiled
 def detect_duplicate(req: DuplicateRequest):
     try:
         import pandas as pd
         # Convert list of dicts to DataFrame
         df = pd.DataFrame(req.existing_reports)
-        detector = DuplicateDetector(df)
-        new_report = {"lat": req.lat, "lon": req.lon, "text": req.text}
-        is_dup, dup_id = detector.check_duplicate(new_report)
-        return {"is_duplicate": is_dup, "duplicate_id": dup_id}
+        # The corpus is only encoded if the SimHash short-circuit does not find the duplicate
+        detector = DuplicateDetector(df, defer_encoding=True)
+        new_report = {"lat": req.lat, "lon": req.lon, "text": req.text, "category": req.category}
+        severity = None
+        if DUPLICATE_ENCODER == "distilbert":
+            # One DistilBERT pass gives both the severity prediction and the duplicate embedding
+            severity, severity_version = predict_versioned(req.text, return_embedding=True)
+            new_report["embedding"] = severity.pop("embedding")
+        match = detector.find_best_match(new_report)
+        is_dup = match is not None and match["score"] > DUPLICATE_SCORE_THRESHOLD
+        response = {
+            "is_duplicate": is_dup,
+            "duplicate_id": match["id"] if is_dup else None,
+            # "lexical" (SimHash) or "embedding"; each method reports its own similarity field
+            "method": match["method"] if match else None,
+            "similarity": match["similarity"] if match else None,
+            "lexical_similarity": match["lexical_similarity"] if match else None,
+        }
+        if severity is not None:
+            response["severity"] = severity
+            response["model_version"] = severity_version
+        return response
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
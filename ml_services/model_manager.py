@@ -0,0 +1,140 @@
+# Hot model reload: each registered model is reloaded in the background when its
+# files change (polled every MODEL_WATCH_SECONDS) or on request, warmed up with
+# sample inputs, then swapped in with a single reference assignment. Requests keep
+# using the old version until the swap, and a failed load leaves it in place.
+import hashlib
+import os
+import threading
+import time
+import traceback
+
+MODEL_WATCH_SECONDS = float(os.getenv("MODEL_WATCH_SECONDS", "30"))  # 0 disables the watcher
+
+
+def files_version(paths):
+    """Cheap identity of a set of files (size + mtime); same scheme as inference.checkpoint_version."""
+    parts = []
+    for path in paths:
+        st = os.stat(path)
+        parts.append(f"{st.st_size}:{st.st_mtime_ns}")
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()[:12]
+
+
+class ModelSlot:
+    def __init__(self, name, paths, load, warmup=None, activate=None, initial=None):
+        self.name = name
+        self.paths = list(paths)
+        self._load = load
+        self._warmup = warmup
+        self._activate = activate
+        self._reload_lock = threading.Lock()
+        self.reloads = 0
+        self.last_error = None
+        self._failed_version = None  # not retried by the watcher until the files change again
+        self.loaded_at = time.time()
+        version = files_version(self.paths)
+        # (model, version) swapped as one reference, so readers never pair a model with another's version
+        self.state = (initial if initial is not None else self._load(), version)
+        if activate is not None:
+            activate(self.current)
+
+    @property
+    def current(self):
+        return self.state[0]
+
+    @property
+    def version(self):
+        return self.state[1]
+
+    def changed(self):
+        try:
+            return files_version(self.paths) not in (self.version, self._failed_version)
+        except FileNotFoundError:
+            return False  # mid-replace, or removed: keep serving what we have
+
+    def reload(self, force=False):
+        """Load, warm up and swap in the files on disk. Returns True if a new version went live."""
+        if not self._reload_lock.acquire(blocking=False):
+            return False  # a reload of this model is already running
+        try:
+            if not force and not self.changed():
+                return False
+            version = files_version(self.paths)
+            self._failed_version = version
+            started = time.perf_counter()
+            candidate = self._load()
+            if self._warmup is not None:
+                self._warmup(candidate)
+            if files_version(self.paths) != version:
+                # files were still being written; the next poll picks up the final version
+                self._failed_version = None
+                return False
+            if self._activate is not None:
+                self._activate(candidate)
+            self.state, self.loaded_at = (candidate, version), time.time()
+            self.reloads += 1
+            self.last_error = self._failed_version = None
+            print(f"Model '{self.name}' reloaded to version {version} in {time.perf_counter() - started:.1f}s")
+            return True
+        except Exception as e:
+            self.last_error = f"{type(e).__name__}: {e}"
+            print(f"Reloading model '{self.name}' failed, still serving {self.version}:")
+            traceback.print_exc()
+            return False
+        finally:
+            self._reload_lock.release()
+
+    def status(self):
+        return {
+            "version": self.version,
+            "loaded_at": self.loaded_at,
+            "reloads": self.reloads,
+            "reloading": self._reload_lock.locked(),
+            "last_error": self.last_error,
+        }
+
+
+class ModelManager:
+    def __init__(self, watch_seconds=MODEL_WATCH_SECONDS):
+        self.slots = {}
+        self.watch_seconds = watch_seconds
+        self._watcher = None
+
+    def register(self, name, paths, load, warmup=None, activate=None, initial=None):
+        """Load a model now (or adopt initial) and track its files for reloads."""
+        self.slots[name] = ModelSlot(name, paths, load, warmup, activate, initial)
+        return self.slots[name].current
+
+    def get(self, name):
+        return self.slots[name].current
+
+    def version(self, name):
+        return self.slots[name].version
+
+    def get_versioned(self, name):
+        """(model, version) from a single read, for responses that report the version that answered."""
+        return self.slots[name].state
+
+    def reload_async(self, name=None, force=False):
+        """Reload one model (or all) in a background thread; serving continues meanwhile."""
+        names = [name] if name else list(self.slots)
+        for n in names:
+            threading.Thread(target=self.slots[n].reload, kwargs={"force": force}, daemon=True).start()
+        return names
+
+    def start_watcher(self):
+        if self.watch_seconds <= 0 or self._watcher is not None:
+            return
+        self._watcher = threading.Thread(target=self._watch, daemon=True)
+        self._watcher.start()
+        print(f"Watching model files every {self.watch_seconds:g}s")
+
+    def _watch(self):
+        while True:
+            time.sleep(self.watch_seconds)
+            for slot in list(self.slots.values()):
+                if slot.changed():
+                    slot.reload()
+
+    def status(self):
+        return {name: slot.status() for name, slot in self.slots.items()}
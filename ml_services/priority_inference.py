@@ -1,11 +1,15 @@
+import os
 import pandas as pd
 import joblib
 from feature_engineering import engineer_features_bulk
 
-# Load trained model and its training columns
-model = joblib.load("priority_model.pkl")
+# Load trained model and its training columns (written by priority_train.py)
+script_dir = os.path.dirname(os.path.abspath(__file__))
+PRIORITY_MODEL_PATH = os.path.join(script_dir, "model", "priority_model.pkl")
+PRIORITY_COLUMNS_PATH = os.path.join(script_dir, "model", "priority_model_columns.pkl")
+model = joblib.load(PRIORITY_MODEL_PATH)
 try:
-    TRAINING_COLUMNS = joblib.load("priority_model_columns.pkl")
+    TRAINING_COLUMNS = joblib.load(PRIORITY_COLUMNS_PATH)
 except:
     TRAINING_COLUMNS = None  # will handle if missing
 
@@ -28,11 +32,8 @@ def predict_priority(new_reports_df, urgency_df=None):
     feats = engineer_features_bulk(new_reports_df, urgency_df)
     X = feats.drop(columns=["id", "report_time"])
 
-    # Align columns with training data
-    for col in TRAINING_COLUMNS:
-        if col not in X.columns:
-            X[col] = 0
-    X = X[TRAINING_COLUMNS]  # reorder to match training
+    # Align columns with training data (missing dummies become 0, order matches training)
+    X = X.reindex(columns=TRAINING_COLUMNS, fill_value=0)
 
     preds = model.predict(X)
     probs = model.predict_proba(X)
@@ -1,12 +1,34 @@
+# Trains the CatBoost priority model.
+#
+# Large history exports are read in chunks and featurized across a process pool:
+#   python priority_train.py --reports reports.csv [--urgency urgency.csv] [--workers 8] [--threads 8]
+#   reports.csv: id,category,report_count,lat,lon,report_time (+ urgency_high_prob if --urgency is not given);
+#                other columns are ignored
+#   urgency.csv: id,urgency_high_prob (the last row wins for a repeated id)
+# Without --reports it trains on the small example set below.
+import argparse
+import os
+import pickle
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
 import numpy as np
 from datetime import datetime
 from catboost import CatBoostClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report
-import joblib
 
-from feature_engineering import engineer_features_bulk, assign_priority
+from feature_engineering import engineer_features_bulk, assign_priority_bulk
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+# Same files ml_api.load_priority_model reads
+PRIORITY_MODEL_PATH = os.path.join(script_dir, "model", "priority_model.pkl")
+PRIORITY_COLUMNS_PATH = os.path.join(script_dir, "model", "priority_model_columns.pkl")
+CHUNK_ROWS = 100_000
+# Only these columns are read, so extra columns in an export never become features
+REPORT_COLUMNS = ["id", "category", "report_count", "lat", "lon", "report_time", "urgency_high_prob"]
 
 # === Load training data (replace with DB or CSV in production) ===
 reports = pd.DataFrame([
@@ -21,33 +43,117 @@ urgency = pd.DataFrame([
     {"id": 3, "urgency_high_prob": 0.05, "urgency_medium_prob": 0.25, "urgency_low_prob": 0.70},
 ])
 
-if __name__ == "__main__":
-    print(">>> Starting training...")
 
-    # === Feature engineering ===
-    features = engineer_features_bulk(reports, urgency)
-    features["priority"] = features.apply(assign_priority, axis=1)
+# === Chunked feature pipeline ===
+def read_chunks(reports_path, urgency, chunk_rows=CHUNK_ROWS):
+    """Report chunks with urgency_high_prob attached (from the urgency table when given)."""
+    for chunk in pd.read_csv(reports_path, chunksize=chunk_rows, usecols=lambda c: c in REPORT_COLUMNS):
+        if urgency is not None:
+            chunk = chunk.drop(columns=["urgency_high_prob"], errors="ignore")
+            chunk["urgency_high_prob"] = chunk["id"].map(urgency)
+        elif "urgency_high_prob" not in chunk.columns:
+            chunk["urgency_high_prob"] = np.nan
+        yield chunk
 
-    X = features.drop(columns=["id", "report_time", "priority"])
-    y = features["priority"]
+def featurize_chunk(chunk, now, in_history=False):
+    """engineer_features_bulk + assign_priority_bulk on one chunk (runs in a pool worker)."""
+    features = engineer_features_bulk(chunk.drop(columns=["urgency_high_prob"]), now=now, in_history=in_history)
+    # set positionally rather than merged on id, so a repeated report id cannot multiply rows
+    features["urgency_score"] = chunk["urgency_high_prob"].fillna(0.0).to_numpy()
+    features["priority"] = assign_priority_bulk(features)
+    return features.drop(columns=["id", "report_time"])
+
+def build_training_frame(chunks, workers, now, in_history=False):
+    """Featurize chunks in parallel; dummy columns missing from a chunk become 0."""
+    parts, pending = [], deque()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for chunk in chunks:
+            pending.append(pool.submit(featurize_chunk, chunk, now, in_history))
+            # bounded read-ahead: raw chunks never pile up in memory
+            if len(pending) >= 2 * workers:
+                parts.append(pending.popleft().result())
+        parts.extend(f.result() for f in pending)
+    features = pd.concat(parts, ignore_index=True)
+    dummies = [c for c in features.columns if c.startswith(("cat_", "tod_"))]
+    features[dummies] = features[dummies].fillna(0).astype(int)
+    return features
+
+def dump_atomic(obj, path):
+    """Pickle to a temp file and rename it into place, so the model watcher never reads a partial file."""
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
 
+def log_rate(stage, rows, seconds):
+    print(f"[{stage}] {rows} rows in {seconds:.1f}s ({rows / max(seconds, 1e-9):,.0f} rows/s)")
+
+def train_priority_model(X, y, iterations, threads, verbose=10):
     model = CatBoostClassifier(
-        iterations=50,
+        iterations=iterations,
         learning_rate=0.1,
         depth=4,
         loss_function="MultiClass",
-        verbose=10
+        thread_count=threads,
+        verbose=verbose
     )
+    model.fit(X, y)
+    return model
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the CatBoost priority model")
+    parser.add_argument("--reports", help="reports CSV (defaults to the built-in example rows)")
+    parser.add_argument("--urgency", help="CSV with id,urgency_high_prob")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="feature engineering processes")
+    parser.add_argument("--threads", type=int, default=os.cpu_count(), help="CatBoost thread_count")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--val-size", type=float, default=0.2, help="held-out fraction for the report (0 = training-set report)")
+    parser.add_argument("--in-geo-history", action="store_true",
+                        help="the reports are part of the geo index history.csv; leave each report out of its own cell count")
+    args = parser.parse_args()
+
+    print(">>> Starting training...")
+    now = pd.Timestamp.now("UTC")
+
+    # === Feature engineering ===
+    started = time.perf_counter()
+    if args.reports:
+        urgency_table = None
+        if args.urgency:
+            urgency_table = (pd.read_csv(args.urgency, usecols=["id", "urgency_high_prob"])
+                             .drop_duplicates("id", keep="last").set_index("id")["urgency_high_prob"])
+        features = build_training_frame(read_chunks(args.reports, urgency_table, args.chunk_rows), args.workers, now, args.in_geo_history)
+    else:
+        features = engineer_features_bulk(reports, urgency, now=now)
+        features["priority"] = assign_priority_bulk(features)
+        features = features.drop(columns=["id", "report_time"])
+    log_rate("features", len(features), time.perf_counter() - started)
+
+    X = features.drop(columns=["priority"])
+    y = features["priority"]
+    if args.val_size > 0 and len(X) >= 50:
+        X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=args.val_size, random_state=42)
+    else:
+        X_train, X_val, y_train, y_val = X, X, y, y
 
     print(">>> Training priority model...")
-    model.fit(X, y)
+    started = time.perf_counter()
+    model = train_priority_model(X_train, y_train, args.iterations, args.threads)
+    log_rate("catboost fit", len(X_train), time.perf_counter() - started)
 
-    y_pred = model.predict(X)
-    print("\n=== Training Set Report ===")
-    print(classification_report(y, y_pred))
+    started = time.perf_counter()
+    y_pred = model.predict(X_val)
+    log_rate("catboost predict", len(X_val), time.perf_counter() - started)
+    print(f"\n=== {'Validation' if X_val is not X else 'Training Set'} Report ===")
+    print(classification_report(y_val, np.ravel(y_pred)))
 
-    # after model.fit(...)
-    joblib.dump(model, "models/priority_model.pkl")
-    joblib.dump(X.columns.tolist(), "models/priority_model_columns.pkl") # save training features
+    os.makedirs(os.path.dirname(PRIORITY_MODEL_PATH), exist_ok=True)
+    # columns first: ml_api rejects a model whose feature names differ from the columns file,
+    # and reloads once the model file is replaced too
+    dump_atomic(X.columns.tolist(), PRIORITY_COLUMNS_PATH)  # save training features
+    dump_atomic(model, PRIORITY_MODEL_PATH)
 
-    print("\n>>> Model saved as priority_model.pkl")
+    print(f"\n>>> Model saved as {PRIORITY_MODEL_PATH}")
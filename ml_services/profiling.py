@@ -0,0 +1,170 @@
+# Opt-in request profiling. A request is profiled when it carries "X-Profile: 1" or
+# is picked by the sampling rate set with set_sample_rate() (admin toggle). The
+# @profiled endpoint decorator then runs cProfile, plus torch.profiler when torch is
+# loaded (the DistilBERT forward pass), in the thread that executes the endpoint, and
+# stores the result in a bounded on-disk ring buffer of PROFILE_KEEP entries.
+# ProfilingMiddleware is plain ASGI, so a request that is not profiled costs one
+# header lookup and one ContextVar get, without BaseHTTPMiddleware's extra task.
+#
+#   app.add_middleware(profiling.ProfilingMiddleware)
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import re
+import shutil
+import sys
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from functools import wraps
+
+from starlette.datastructures import Headers, MutableHeaders
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(script_dir, "profiles"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+PROFILE_HEADER = "X-Profile"
+PROFILE_FILES = ("meta.json", "python.prof", "python.txt", "torch_ops.txt", "torch_trace.json")
+
+_sample_rate = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Per-request holder set by the middleware; the decorator records the profile id in it
+_request = ContextVar("profile_request", default=None)
+_ID_RE = re.compile(r"^[0-9]{13}-[0-9a-f]{8}$")
+# cProfile (3.12+) and torch.profiler each allow one active session per process
+_session = threading.Lock()
+
+
+def set_sample_rate(rate):
+    global _sample_rate
+    _sample_rate = min(max(float(rate), 0.0), 1.0)
+    return _sample_rate
+
+def sample_rate():
+    return _sample_rate
+
+def begin_request(headers):
+    """Called by the middleware; returns the holder when this request is to be profiled, else None."""
+    if headers.get(PROFILE_HEADER) == "1" or (_sample_rate > 0 and random.random() < _sample_rate):
+        holder = {"id": None, "active": False, "skipped": None}
+        _request.set(holder)
+        return holder
+    return None
+
+
+class ProfilingMiddleware:
+    """
+    Marks requests for profiling and adds X-Profile-Id to the response of a profiled one,
+    or X-Profile-Skipped when the profile could not be taken.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        holder = begin_request(Headers(scope=scope))
+        if holder is None:
+            return await self.app(scope, receive, send)
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                if holder["id"]:
+                    MutableHeaders(scope=message).append("X-Profile-Id", holder["id"])
+                elif holder["skipped"]:
+                    MutableHeaders(scope=message).append("X-Profile-Skipped", holder["skipped"])
+            await send(message)
+
+        await self.app(scope, receive, send_with_profile_id)
+
+
+def profiled(fn):
+    """Endpoint decorator (sync endpoints, which FastAPI runs in a worker thread)."""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        holder = _request.get()
+        if holder is None or holder["active"]:
+            return fn(*args, **kwargs)  # not requested, or nested inside a profiled endpoint
+        if not _session.acquire(blocking=False):
+            holder["skipped"] = "busy"  # another request is being profiled right now
+            return fn(*args, **kwargs)
+        holder["active"] = True
+        torch_prof = None
+        if "torch" in sys.modules:
+            torch = sys.modules["torch"]
+            torch_prof = torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU], record_shapes=True)
+            torch_prof.__enter__()
+        py_prof = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            py_prof.enable()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                py_prof.disable()
+                if torch_prof is not None:
+                    torch_prof.__exit__(None, None, None)
+        finally:
+            try:
+                holder["id"] = _save(fn.__name__, time.perf_counter() - started, py_prof, torch_prof)
+            finally:
+                holder["active"] = False
+                _session.release()
+    return wrapper
+
+
+def _save(endpoint, seconds, py_prof, torch_prof):
+    profile_id = f"{int(time.time() * 1000):013d}-{uuid.uuid4().hex[:8]}"
+    tmp = os.path.join(PROFILE_DIR, f".{profile_id}.tmp")
+    os.makedirs(tmp, exist_ok=True)
+
+    py_prof.dump_stats(os.path.join(tmp, "python.prof"))
+    out = io.StringIO()
+    pstats.Stats(py_prof, stream=out).sort_stats("cumulative").print_stats(40)
+    with open(os.path.join(tmp, "python.txt"), "w") as f:
+        f.write(out.getvalue())
+    if torch_prof is not None:
+        torch_prof.export_chrome_trace(os.path.join(tmp, "torch_trace.json"))
+        with open(os.path.join(tmp, "torch_ops.txt"), "w") as f:
+            f.write(torch_prof.key_averages(group_by_input_shape=True).table(sort_by="cpu_time_total", row_limit=40))
+    files = sorted(os.listdir(tmp) + ["meta.json"])
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump({
+            "id": profile_id,
+            "endpoint": endpoint,
+            "duration_ms": 1000.0 * seconds,
+            "created_at": time.time(),
+            "files": files,
+        }, f)
+    os.replace(tmp, os.path.join(PROFILE_DIR, profile_id))
+    _trim()
+    return profile_id
+
+def _trim():
+    ids = sorted(name for name in os.listdir(PROFILE_DIR) if _ID_RE.match(name))
+    for old in ids[:max(len(ids) - PROFILE_KEEP, 0)]:
+        shutil.rmtree(os.path.join(PROFILE_DIR, old), ignore_errors=True)
+
+
+def list_profiles():
+    """Newest first, with the metadata of each stored profile."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in sorted((n for n in os.listdir(PROFILE_DIR) if _ID_RE.match(n)), reverse=True):
+        try:
+            with open(os.path.join(PROFILE_DIR, name, "meta.json")) as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue  # trimmed while listing
+    return profiles
+
+def profile_path(profile_id, filename):
+    """Path of a stored profile file, or None if it does not exist (ids and names are validated)."""
+    if not _ID_RE.match(profile_id) or filename not in PROFILE_FILES:
+        return None
+    path = os.path.join(PROFILE_DIR, profile_id, filename)
+    return path if os.path.exists(path) else None
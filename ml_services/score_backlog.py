@@ -0,0 +1,200 @@
+# Offline re-scoring of the whole report backlog after a model update: severity
+# (batched DistilBERT, behind the linear cascade when SEVERITY_CASCADE=1, as in the
+# API), priority (feature engineering + CatBoost) and routing, across worker
+# processes. Results are written one part file per input chunk and recorded in a
+# manifest, so an interrupted run picks up where it stopped. Every worker checks
+# that the model files it loaded are the ones the manifest was started with.
+#
+# Usage: python score_backlog.py --input reports.csv --out scores/ [--workers 4] [--threads 2]
+#   reports.csv (or .parquet): id,text,lat,lon[,category,report_count,report_time]
+import argparse
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+
+from model_manager import files_version
+from train_cascade import CASCADE_MODEL_PATH
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+# Files whose change invalidates earlier scores
+MODEL_PATHS = [
+    os.path.join(script_dir, "output_distilbert_multitask", "best_model.pth"),
+    os.path.join(script_dir, "model", "priority_model.pkl"),
+    os.path.join(script_dir, "model", "priority_model_columns.pkl"),
+]
+# same switch cascade.py reads; it falls back to DistilBERT alone when the model file is missing
+if os.getenv("SEVERITY_CASCADE", "0") == "1" and os.path.exists(CASCADE_MODEL_PATH):
+    MODEL_PATHS.append(CASCADE_MODEL_PATH)
+CHUNK_ROWS = 5000
+MANIFEST = "manifest.json"
+
+_model_version = None  # set in each worker by init_worker
+
+
+# === Input ===
+def iter_chunks(path, chunk_rows=CHUNK_ROWS):
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_rows)
+
+def remaining_chunks(path, chunk_rows, done):
+    """(index, chunk) for the chunks not already recorded as done in the manifest."""
+    for index, chunk in enumerate(iter_chunks(path, chunk_rows)):
+        if index not in done:
+            yield index, chunk
+
+
+# === Workers ===
+def check_model_version(expected):
+    version = files_version(MODEL_PATHS)
+    if version != expected:
+        raise RuntimeError(f"model files changed during the run ({expected} -> {version}); rerun with --restart")
+
+def init_worker(threads, model_version):
+    """
+    Runs once per worker process: load the models there, not per chunk. Workers can
+    start late in a run, so the files are checked against the manifest's version
+    before and after loading; a model swapped in meanwhile fails the run instead of
+    being mixed into it.
+    """
+    global _model_version
+    import torch
+    if threads > 0:
+        torch.set_num_threads(threads)
+    check_model_version(model_version)
+    import cascade  # noqa: F401  (loads inference too)
+    import priority_inference  # noqa: F401
+    check_model_version(model_version)
+    _model_version = model_version
+
+def score_chunk(chunk, batch_size, now):
+    import cascade
+    from priority_inference import route_reports
+
+    started = time.perf_counter()
+    reports = chunk.dropna(subset=["id", "text", "lat", "lon"]).drop_duplicates("id").copy()
+    texts = reports["text"].astype(str).tolist()
+    severity = cascade.predict_batch(texts, batch_size=batch_size)
+    severity_s = time.perf_counter() - started
+
+    predicted_category = [s["category"] for s in severity]
+    if "category" not in reports.columns:
+        reports["category"] = predicted_category
+    else:
+        reports["category"] = reports["category"].fillna(pd.Series(predicted_category, index=reports.index))
+    if "report_count" not in reports.columns:
+        reports["report_count"] = 1
+    reports["report_count"] = reports["report_count"].fillna(1)
+    if "report_time" not in reports.columns:
+        reports["report_time"] = now
+    reports["report_time"] = reports["report_time"].fillna(now)
+
+    urgency = pd.DataFrame({
+        "id": reports["id"].to_numpy(),
+        "urgency_high_prob": [s["urgency_probs"].get("high", 0.0) for s in severity],
+    })
+    routed = route_reports(reports[["id", "category", "report_count", "lat", "lon", "report_time"]], urgency)
+
+    out = pd.DataFrame({
+        "id": reports["id"].to_numpy(),
+        "predicted_category": predicted_category,
+        "urgency": [s["urgency"] for s in severity],
+        "urgency_high_prob": urgency["urgency_high_prob"].to_numpy(),
+    }).merge(routed[["id", "predicted_priority", "priority_score", "department"]], on="id", how="left")
+    out["model_version"] = _model_version
+    return out, {"rows": len(reports), "severity_s": severity_s, "total_s": time.perf_counter() - started}
+
+
+# === Manifest ===
+def load_manifest(out_dir, expected, restart):
+    path = os.path.join(out_dir, MANIFEST)
+    if os.path.exists(path) and not restart:
+        with open(path) as f:
+            manifest = json.load(f)
+        stale = {k: (manifest.get(k), v) for k, v in expected.items() if manifest.get(k) != v}
+        if stale:
+            raise SystemExit(f"{path} is from a different run ({stale}); use --restart to rescore from scratch")
+        return manifest
+    for name in os.listdir(out_dir):
+        if name.startswith("part-"):
+            os.remove(os.path.join(out_dir, name))
+    return {**expected, "done": [], "rows": 0}
+
+def save_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+def write_part(out_dir, index, frame):
+    path = os.path.join(out_dir, f"part-{index:05d}.csv")
+    frame.to_csv(path + ".tmp", index=False)
+    os.replace(path + ".tmp", path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-score the report backlog with the current models")
+    parser.add_argument("--input", required=True, help="CSV or Parquet file with id,text,lat,lon[,category,report_count,report_time]")
+    parser.add_argument("--out", required=True, help="output directory (part files + manifest)")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--workers", type=int, default=max((os.cpu_count() or 2) // 2, 1))
+    parser.add_argument("--threads", type=int, default=2, help="torch intra-op threads per worker")
+    parser.add_argument("--batch-size", type=int, default=32, help="texts per DistilBERT forward pass")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing manifest and rescore everything")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    expected = {
+        "input": os.path.abspath(args.input),
+        "input_version": files_version([args.input]),
+        "chunk_rows": args.chunk_rows,
+        "model_version": files_version(MODEL_PATHS),
+        "cascade_threshold": os.getenv("CASCADE_THRESHOLD"),  # overrides the threshold saved with the cascade model
+    }
+    manifest = load_manifest(args.out, expected, args.restart)
+    done = set(manifest["done"])
+    if done:
+        print(f">>> Resuming: {len(done)} chunk(s) / {manifest['rows']} rows already scored")
+    now = pd.Timestamp.now("UTC").strftime("%Y-%m-%d %H:%M:%S")  # report_time for rows without one
+
+    started = time.perf_counter()
+    totals = {"rows": 0, "severity_s": 0.0}
+    pending = {}
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                                 initargs=(args.threads, expected["model_version"])) as pool:
+            def collect(futures):
+                for future in futures:
+                    index = pending.pop(future)
+                    frame, stats = future.result()
+                    write_part(args.out, index, frame)
+                    manifest["done"].append(index)
+                    manifest["rows"] += stats["rows"]
+                    save_manifest(args.out, manifest)
+                    totals["rows"] += stats["rows"]
+                    totals["severity_s"] += stats["severity_s"]
+                    elapsed = time.perf_counter() - started
+                    print(f"chunk {index}: {stats['rows']} rows in {stats['total_s']:.1f}s | overall {totals['rows'] / max(elapsed, 1e-9):,.0f} rows/s")
+
+            for index, chunk in remaining_chunks(args.input, args.chunk_rows, done):
+                pending[pool.submit(score_chunk, chunk, args.batch_size, now)] = index
+                # bounded read-ahead so the input is never held in memory
+                if len(pending) >= 2 * args.workers:
+                    finished, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                    collect(finished)
+            collect(as_completed(list(pending)))
+    except BrokenProcessPool:
+        raise SystemExit("A worker failed (see its traceback above); finished chunks are kept in the manifest")
+
+    elapsed = time.perf_counter() - started
+    scored = totals["rows"]
+    print(f"\n>>> Scored {scored} rows in {elapsed:.1f}s ({scored / max(elapsed, 1e-9):,.0f} rows/s, "
+          f"{totals['severity_s'] / max(scored, 1) * 1000:.2f} ms/report in DistilBERT per worker). "
+          f"{manifest['rows']} rows total in {args.out}")
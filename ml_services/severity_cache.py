@@ -0,0 +1,166 @@
+# Result cache for severity predictions, keyed by normalised text + model version.
+#
+# Tier 1 is an in-process LRU with TTL. Tier 2 (optional, SEVERITY_CACHE_DB=path)
+# is a SQLite file in WAL mode that every uvicorn worker on the node reads and
+# writes. Entries of any other model version are ignored and purged, so a new
+# checkpoint invalidates the cache without manual flushing.
+import copy
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+CACHE_TTL_SECONDS = float(os.getenv("SEVERITY_CACHE_TTL", "3600"))
+CACHE_MAX_ENTRIES = int(os.getenv("SEVERITY_CACHE_SIZE", "4096"))
+SHARED_CACHE_PATH = os.getenv("SEVERITY_CACHE_DB")
+SHARED_MAX_ENTRIES = int(os.getenv("SEVERITY_CACHE_SHARED_SIZE", "100000"))
+SHARED_CLEANUP_EVERY = 500  # inserts between expiry/size sweeps of the shared tier
+
+_WS_RE = re.compile(r"\s+")
+
+def normalize_text(text):
+    """Case, unicode form, whitespace and trailing punctuation do not change the cache key."""
+    text = unicodedata.normalize("NFKC", str(text)).lower()
+    return _WS_RE.sub(" ", text).strip().rstrip(".!?,;: ")
+
+
+class SeverityCache:
+    def __init__(self, ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES,
+                 shared_path=SHARED_CACHE_PATH, shared_max_entries=SHARED_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.shared_path = shared_path
+        self.shared_max_entries = shared_max_entries
+        self._memory = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._version = None
+        self._inserts = 0
+        self.stats = {"memory_hits": 0, "shared_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+        if shared_path:
+            self._init_shared()
+
+    # === Shared tier ===
+    def _conn(self):
+        # sqlite3 connections must not be shared across the threadpool
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.shared_path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_shared(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.shared_path)), exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS severity_cache ("
+            " key TEXT PRIMARY KEY, model_version TEXT NOT NULL, value TEXT NOT NULL,"
+            " expires_at REAL NOT NULL, created_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS severity_cache_created ON severity_cache (created_at)")
+
+    def _shared_get(self, key, now):
+        try:
+            row = self._conn().execute(
+                "SELECT value FROM severity_cache WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print("Severity cache read error:", e)
+            return None
+        return json.loads(row[0]) if row else None
+
+    def _shared_put(self, key, version, value, now):
+        try:
+            conn = self._conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO severity_cache (key, model_version, value, expires_at, created_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, version, json.dumps(value), now + self.ttl, now),
+            )
+            with self._lock:
+                self._inserts += 1
+                cleanup = self._inserts % SHARED_CLEANUP_EVERY == 0
+            if cleanup:
+                conn.execute("DELETE FROM severity_cache WHERE expires_at <= ?", (now,))
+                conn.execute(
+                    "DELETE FROM severity_cache WHERE key IN (SELECT key FROM severity_cache"
+                    " ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                    (self.shared_max_entries,),
+                )
+        except sqlite3.Error as e:
+            print("Severity cache write error:", e)
+
+    # === Lookup ===
+    def _check_version(self, version):
+        if version == self._version:
+            return
+        with self._lock:
+            if self._version is not None:
+                self.stats["invalidations"] += 1
+            self._memory.clear()
+            self._version = version
+        if self.shared_path:
+            try:
+                self._conn().execute("DELETE FROM severity_cache WHERE model_version != ?", (version,))
+            except sqlite3.Error as e:
+                print("Severity cache purge error:", e)
+
+    def get_or_compute(self, text, version, compute):
+        """
+        (result, model version) for text. version is the current model version, used for
+        the lookup; on a miss compute(text) must return (result, version of the model that
+        produced it), and the result is stored and reported under that version, which
+        differs from the lookup version when a model was swapped in meanwhile.
+        Results are copies, so callers may modify them.
+        """
+        self._check_version(version)
+        key = f"{version}:{normalize_text(text)}"
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[0] > now:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return copy.deepcopy(entry[1]), version
+
+        value = self._shared_get(key, now) if self.shared_path else None
+        with self._lock:
+            self.stats["shared_hits" if value is not None else "misses"] += 1
+        if value is None:
+            value, computed_version = compute(text)
+            if computed_version != version:
+                self._check_version(computed_version)
+                version, key = computed_version, f"{computed_version}:{normalize_text(text)}"
+            if self.shared_path:
+                self._shared_put(key, version, value, now)
+
+        with self._lock:
+            self._memory[key] = (now + self.ttl, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                self.stats["evictions"] += 1
+        return copy.deepcopy(value), version
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats["memory_hits"] + stats["shared_hits"] + stats["misses"]
+        hits = stats["memory_hits"] + stats["shared_hits"]
+        return {
+            **stats,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "shared_enabled": bool(self.shared_path),
+            "model_version": self._version,
+        }
+
+
+severity_cache = SeverityCache()
@@ -0,0 +1,78 @@
+import hashlib
+import re
+
+import numpy as np
+
+# === Config ===
+SIMHASH_BITS = 64
+LSH_BANDS = 4               # 4 x 16-bit bands: any pair within 3 differing bits shares a band
+MAX_HAMMING = 3             # near-verbatim threshold
+
+_BAND_BITS = SIMHASH_BITS // LSH_BANDS
+_BAND_MASK = np.uint64((1 << _BAND_BITS) - 1)
+_BIT_SHIFTS = np.arange(SIMHASH_BITS, dtype=np.uint64)
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+# === Signatures ===
+def _features(text):
+    tokens = _TOKEN_RE.findall(str(text).lower())
+    # unigrams + bigrams, so reordering a sentence still moves the hash
+    return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+def simhash(text):
+    """64-bit SimHash of a text as np.uint64."""
+    feats = _features(text)
+    if not feats:
+        return np.uint64(0)
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(f.encode(), digest_size=8).digest(), "little") for f in feats],
+        dtype=np.uint64,
+    )
+    bits = ((hashes[:, None] >> _BIT_SHIFTS) & np.uint64(1)).astype(np.int32)
+    votes = 2 * bits.sum(axis=0) - len(feats)
+    return np.uint64(np.sum((votes > 0).astype(np.uint64) << _BIT_SHIFTS))
+
+def simhash_many(texts):
+    return np.array([simhash(t) for t in texts], dtype=np.uint64)
+
+def hamming(sig, sigs):
+    """Bit distance between one signature and an array of signatures."""
+    x = np.bitwise_xor(np.asarray(sigs, dtype=np.uint64), np.uint64(sig))
+    return np.unpackbits(x.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+def bands(sigs):
+    """(n, LSH_BANDS) band values of an array of signatures."""
+    sigs = np.asarray(sigs, dtype=np.uint64).reshape(-1, 1)
+    shifts = np.arange(LSH_BANDS, dtype=np.uint64) * np.uint64(_BAND_BITS)
+    return (sigs >> shifts) & _BAND_MASK
+
+
+# === LSH table ===
+class SimHashLSH:
+    """
+    Banded LSH over an array of signatures. Each band is kept as a sorted copy
+    plus its argsort, so a lookup is LSH_BANDS searchsorted calls and the table
+    can be rebuilt from a memory-mapped signature array without Python loops.
+    """
+    def __init__(self, sigs):
+        self.sigs = np.asarray(sigs, dtype=np.uint64)
+        band_values = bands(self.sigs)
+        self.order = np.argsort(band_values, axis=0, kind="stable")
+        self.sorted = np.take_along_axis(band_values, self.order, axis=0)
+
+    def candidates(self, sig, max_hamming=MAX_HAMMING):
+        """Row positions whose signature is within max_hamming bits of sig."""
+        if len(self.sigs) == 0:
+            return np.empty(0, dtype=np.int64)
+        query = bands([sig])[0]
+        hits = []
+        for b in range(LSH_BANDS):
+            left = np.searchsorted(self.sorted[:, b], query[b], side="left")
+            right = np.searchsorted(self.sorted[:, b], query[b], side="right")
+            if right > left:
+                hits.append(self.order[left:right, b])
+        if not hits:
+            return np.empty(0, dtype=np.int64)
+        pos = np.unique(np.concatenate(hits))
+        return pos[hamming(sig, self.sigs[pos]) <= max_hamming]
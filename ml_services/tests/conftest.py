@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The services are flat modules run from ml_services/, so make them importable the same way
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
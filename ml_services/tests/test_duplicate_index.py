@@ -0,0 +1,84 @@
+import logging
+import os
+import time
+
+import numpy as np
+
+from duplicate_index import KEEP_SNAPSHOTS, DuplicateIndex
+from simhash import simhash_many
+
+NOW = time.time()
+DAY = 24 * 3600
+
+
+def make_index(window_days=30):
+    texts = ["pothole on main road", "garbage not collected", "streetlight broken", "old pothole report"]
+    emb = np.eye(4, 8, dtype=np.float32)
+    return DuplicateIndex(
+        ids=np.array([1, 2, 3, 4]),
+        coords=[(28.6100, 77.2300), (28.6101, 77.2301), (28.6102, 77.2299), (28.6100, 77.2300)],
+        embeddings=emb,
+        model_name="test-encoder",
+        categories=np.array(["Pothole", "garbage", None, "pothole"], dtype=object),
+        times=[NOW - DAY, NOW - 2 * DAY, np.nan, NOW - 40 * DAY],
+        simhashes=simhash_many(texts),
+        created_at=NOW,
+        window_seconds=window_days * DAY,
+    )
+
+
+def ids_at(index, pos):
+    return sorted(int(i) for i in index.ids[pos])
+
+
+def test_snapshot_round_trip(tmp_path):
+    index = make_index()
+    index.save_snapshot(str(tmp_path))
+
+    loaded = DuplicateIndex.load_snapshot(str(tmp_path), "test-encoder", dim=8)
+    assert loaded is not None
+    # the 40-day-old report is outside the window and dropped on load
+    assert sorted(int(i) for i in loaded.ids) == [1, 2, 3]
+    pos, _ = loaded.nearby(28.61, 77.23, 100, category="pothole", now=NOW)
+    assert ids_at(loaded, pos) == [1, 3]  # same category plus uncategorised
+    row = int(np.nonzero(loaded.ids == 2)[0][0])
+    np.testing.assert_array_equal(loaded.embeddings[row], index.embeddings[int(np.nonzero(index.ids == 2)[0][0])])
+
+
+def test_snapshot_rejects_other_encoder_or_dim(tmp_path, caplog):
+    make_index().save_snapshot(str(tmp_path))
+    with caplog.at_level(logging.WARNING, logger="duplicate_index"):
+        assert DuplicateIndex.load_snapshot(str(tmp_path), "other-encoder", dim=8) is None
+    assert "built with other-encoder" not in caplog.text and "built with test-encoder" in caplog.text
+    assert DuplicateIndex.load_snapshot(str(tmp_path), "test-encoder", dim=16) is None
+    assert DuplicateIndex.load_snapshot(str(tmp_path / "missing"), "test-encoder") is None
+
+
+def test_snapshots_are_pruned_and_current_points_at_latest(tmp_path):
+    paths = [make_index().save_snapshot(str(tmp_path)) for _ in range(KEEP_SNAPSHOTS + 2)]
+    snaps = sorted(d for d in os.listdir(tmp_path) if d.startswith("snap-"))
+    assert len(snaps) == KEEP_SNAPSHOTS
+    with open(tmp_path / "CURRENT") as f:
+        assert f.read() == os.path.basename(paths[-1])
+
+def test_evicted_returns_new_index_and_leaves_original_intact():
+    index = make_index()
+    evicted = index.evicted(now=NOW)
+    assert evicted is not index
+    assert len(index) == 4  # concurrent readers of the old index keep a consistent view
+    assert sorted(int(i) for i in evicted.ids) == [1, 2, 3]
+    assert evicted.evicted(now=NOW) is evicted  # nothing stale: no copy
+
+    resolved = evicted.evicted(now=NOW, resolved_ids=[2])
+    assert sorted(int(i) for i in resolved.ids) == [1, 3]
+    pos, _ = resolved.nearby(28.61, 77.23, 100, now=NOW)
+    assert ids_at(resolved, pos) == [1, 3]
+
+def test_near_verbatim_uses_simhash_within_radius():
+    index = make_index()
+    sig = simhash_many(["Pothole on MAIN road!"])[0]
+    pos, dist, bits = index.near_verbatim(28.61, 77.23, 100, sig, category="pothole", now=NOW)
+    assert ids_at(index, pos) == [1]
+    assert bits.tolist() == [0]
+    pos, _, _ = index.near_verbatim(28.70, 77.30, 100, sig, category="pothole", now=NOW)
+    assert len(pos) == 0
@@ -0,0 +1,51 @@
+import pandas as pd
+import pytest
+
+import feature_engineering
+from feature_engineering import assign_priority, assign_priority_bulk, engineer_features_bulk
+
+
+@pytest.fixture(autouse=True)
+def no_geo_index(monkeypatch):
+    monkeypatch.setattr(feature_engineering, "get_geo_index", lambda: None)
+
+
+def time_of_day(hour):
+    # the row-wise mapping the np.select bins replaced
+    if 6 <= hour < 12: return "morning"
+    elif 12 <= hour < 17: return "afternoon"
+    elif 17 <= hour < 21: return "evening"
+    else: return "night"
+
+
+def test_assign_priority_bulk_matches_row_wise():
+    urgency = [0.0, 0.29, 0.3, 0.5, 0.7, 0.71, 1.0]
+    counts = [0, 1, 2, 3, 10, 11]
+    df = pd.DataFrame([{"urgency_score": u, "report_count": c} for u in urgency for c in counts])
+    expected = [assign_priority(row) for _, row in df.iterrows()]
+    assert assign_priority_bulk(df).tolist() == expected
+
+
+def test_time_of_day_bins_match_row_wise():
+    reports = pd.DataFrame({
+        "id": range(24),
+        "category": "pothole",
+        "report_count": 1,
+        "report_time": [f"2025-09-10 {h:02d}:30:00" for h in range(24)],
+    })
+    features = engineer_features_bulk(reports, now="2025-09-11")
+    tod = features.filter(like="tod_").idxmax(axis=1).str[len("tod_"):]
+    assert tod.tolist() == [time_of_day(h) for h in range(24)]
+
+
+def test_urgency_is_merged_by_id_and_defaults_to_zero():
+    reports = pd.DataFrame({
+        "id": [1, 2, 3],
+        "category": ["pothole", "garbage", "pothole"],
+        "report_count": [12, 1, 3],
+        "report_time": ["2025-09-10 08:00:00"] * 3,
+    })
+    urgency = pd.DataFrame({"id": [3, 1], "urgency_high_prob": [0.9, 0.1]})
+    features = engineer_features_bulk(reports, urgency, now="2025-09-11")
+    assert features["urgency_score"].tolist() == [0.1, 0.0, 0.9]
+    assert assign_priority_bulk(features).tolist() == ["High", "Low", "High"]
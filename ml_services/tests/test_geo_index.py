@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from geo_index import GEO_FEATURES, build_geo_index
+
+
+@pytest.fixture
+def geo(tmp_path):
+    pois = pd.DataFrame({
+        "lat": [28.6120, 28.7020, 28.6120],
+        "lon": [77.2320, 77.3020, 77.2320],
+        "type": ["school", "hospital", "junction"],
+    })
+    history = pd.DataFrame({
+        "lat": [28.6120, 28.6121, 28.6122, 28.7020, 28.7021],
+        "lon": [77.2320, 77.2321, 77.2322, 77.3020, 77.3021],
+        "category": ["Pothole", np.nan, "pothole", "garbage", None],
+        "report_time": ["2025-01-01 00:00"] * 5,
+        "resolved_time": ["2025-01-02 00:00", "2025-01-03 00:00", "2025-01-01 12:00", "2025-01-01 03:00", "2025-01-01 06:00"],
+    })
+    return build_geo_index(pois, history, str(tmp_path / "geo_index.npz"))
+
+
+def test_missing_categories_are_unknown(geo):
+    assert geo.categories.tolist() == ["garbage", "pothole"]
+    pothole = geo.lookup(28.612, 77.232, "pothole")
+    assert pothole["past_dept_response_time_avg"] == pytest.approx(18.0)  # 24h and 12h; the NaN-category row is not pothole
+    assert geo.global_hours == pytest.approx(13.0)  # rows with a known category only
+    assert geo.lookup(28.612, 77.232, np.nan)["past_dept_response_time_avg"] == pytest.approx(13.0)
+
+
+def test_lookup_and_lookup_bulk_agree(geo):
+    lats = [28.6120, 28.7020, 10.0, 28.6121, 28.7021]
+    lons = [77.2320, 77.3020, 10.0, 77.2321, 77.3021]
+    cats = ["pothole", np.nan, None, "streetlight", "GARBAGE"]
+    for in_history in (False, True):
+        bulk = geo.lookup_bulk(lats, lons, pd.Series(cats, dtype=object), in_history=in_history)
+        single = pd.DataFrame([geo.lookup(a, b, c, in_history) for a, b, c in zip(lats, lons, cats)])
+        pd.testing.assert_frame_equal(bulk[GEO_FEATURES], single[GEO_FEATURES], check_dtype=False)
+
+
+def test_in_history_excludes_own_report(geo):
+    assert geo.lookup(28.612, 77.232)["historical_issue_count_in_cell"] == 3
+    assert geo.lookup(28.612, 77.232, in_history=True)["historical_issue_count_in_cell"] == 2
+    assert geo.lookup(10.0, 10.0, in_history=True)["historical_issue_count_in_cell"] == 0
+    counts = geo.lookup_bulk([28.612, 28.612], [77.232, 77.232], in_history=np.array([True, False]))
+    assert counts["historical_issue_count_in_cell"].tolist() == [2, 3]
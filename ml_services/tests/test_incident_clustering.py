@@ -0,0 +1,93 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from incident_clustering import IncidentClusterer, cluster_online
+
+DAY = 24 * 3600
+
+
+def test_nearby_reports_of_same_category_share_an_incident():
+    c = IncidentClusterer(radius_m=100)
+    a = c.assign(1, 28.6100, 77.2300, "Pothole", 0)
+    b = c.assign(2, 28.6102, 77.2301, "pothole", 60)
+    other = c.assign(3, 28.6101, 77.2300, "garbage", 120)
+    far = c.assign(4, 28.7000, 77.3000, "pothole", 180)
+    assert a == b
+    assert len({a, other, far}) == 3
+    assert c.report_count(1) == c.report_count(2) == 2
+    assert c.assign(2, 0.0, 0.0, "pothole", 240) == a  # known id: no-op
+    assert c.report_count("unknown") == 1
+
+
+def test_missing_categories_do_not_crash_and_match_any_incident():
+    c = IncidentClusterer(radius_m=100)
+    a = c.assign(1, 28.61, 77.23, np.nan, 0)
+    assert c.assign(2, 28.61, 77.23, None, 10) == a
+    assert c.assign(3, 28.61, 77.23, "", 20) == a
+    assert c.assign(4, 28.61, 77.23, "Pothole", 30) == a
+    assert c.clusters[a]["category"] == "pothole"
+    assert c.report_count(4) == 4
+
+
+def test_quiet_incidents_are_evicted():
+    c = IncidentClusterer(radius_m=100, gap_seconds=DAY)
+    old = c.assign(1, 28.61, 77.23, "pothole", 0)
+    live = c.assign(2, 28.70, 77.30, "garbage", 0.8 * DAY)
+    c.assign(3, 28.80, 77.40, "parks", 1.6 * DAY)
+    assert old not in c.clusters
+    assert live in c.clusters
+    assert "1" not in c.report_cluster
+    assert c.report_count(1) == 1
+    # a report at the old spot now starts a fresh incident
+    assert c.assign(5, 28.61, 77.23, "pothole", 1.7 * DAY) not in (old, live)
+    assert len(c.to_frame()) == len(c)
+
+
+def test_concurrent_assign_keeps_counts_consistent():
+    c = IncidentClusterer(radius_m=100)
+
+    def worker(offset):
+        for i in range(200):
+            c.assign(f"{offset}-{i}", 28.61 + (i % 5) * 1e-5, 77.23, "pothole", float(i))
+
+    threads = [threading.Thread(target=worker, args=(t,)) for t in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sum(cl["report_count"] for cl in c.clusters.values()) == 800
+    assert len(c.report_cluster) == 800
+
+
+def test_cluster_online_labels_every_report():
+    reports = pd.DataFrame({
+        "id": [1, 2, 3, 4],
+        "lat": [28.61, 28.61, 28.61, 28.70],
+        "lon": [77.23, 77.23, 77.23, 77.30],
+        "category": ["pothole", np.nan, "pothole", "garbage"],
+        "report_time": ["2025-01-01", "2025-01-02", "2025-03-01", "2025-03-01"],
+    })
+    _, labels = cluster_online(reports, gap_seconds=7 * DAY)
+    assert labels[0] == labels[1]
+    assert labels[2] != labels[0]  # the first incident was closed by then
+    assert len(set(labels.tolist())) == 3
+
+
+def test_resync_skips_reports_of_closed_incidents():
+    c = IncidentClusterer(radius_m=100, gap_seconds=DAY)
+    reports = [(1, 28.61, 77.23, 0.0), (2, 28.70, 77.30, 2 * DAY)]
+
+    def sync():
+        cutoff = c.closed_before(max(t for *_, t in reports))
+        for rid, lat, lon, t in reports:
+            if t >= cutoff:
+                c.assign(rid, lat, lon, "pothole", t)
+
+    sync()
+    assert c.report_count(1) == 1 and len(c) == 1  # report 1's incident was closed by report 2
+    sync()
+    sync()
+    assert len(c) == 1
+    assert c.closed_before() == DAY
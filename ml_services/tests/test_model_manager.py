@@ -0,0 +1,68 @@
+import os
+import pickle
+
+from model_manager import ModelManager, files_version
+
+
+def write(path, obj, mtime):
+    with open(path, "wb") as f:
+        pickle.dump(obj, f)
+    os.utime(path, ns=(mtime, mtime))  # distinct versions even within one mtime tick
+
+
+def loader(path):
+    def load():
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    return load
+
+
+def test_reload_swaps_model_and_version_together(tmp_path):
+    path = str(tmp_path / "model.pkl")
+    write(path, {"v": 1}, 1_000_000_000)
+    manager = ModelManager(watch_seconds=0)
+    manager.register("m", [path], loader(path))
+    assert manager.get_versioned("m") == ({"v": 1}, files_version([path]))
+
+    write(path, {"v": 2}, 2_000_000_000)
+    assert manager.slots["m"].reload()
+    model, version = manager.get_versioned("m")
+    assert model == {"v": 2} and version == files_version([path])
+    assert manager.status()["m"]["reloads"] == 1
+
+
+def test_bad_file_keeps_serving_the_old_version(tmp_path):
+    path = str(tmp_path / "model.pkl")
+    write(path, {"v": 1}, 1_000_000_000)
+    manager = ModelManager(watch_seconds=0)
+    manager.register("m", [path], loader(path))
+    slot = manager.slots["m"]
+    before = slot.state
+
+    with open(path, "wb") as f:
+        f.write(b"not a pickle")
+    os.utime(path, ns=(2_000_000_000, 2_000_000_000))
+    assert not slot.reload()
+    assert slot.state is before
+    assert slot.last_error.startswith("UnpicklingError")
+    assert not slot.changed()  # the watcher does not retry the same bad file
+
+    write(path, {"v": 3}, 3_000_000_000)
+    assert slot.changed() and slot.reload()
+    assert manager.get("m") == {"v": 3} and slot.last_error is None
+
+
+def test_failed_warmup_is_rolled_back(tmp_path):
+    path = str(tmp_path / "model.pkl")
+    write(path, {"v": 1}, 1_000_000_000)
+
+    def warmup(model):
+        if model["v"] == 2:
+            raise ValueError("columns mismatch")
+
+    manager = ModelManager(watch_seconds=0)
+    manager.register("m", [path], loader(path), warmup=warmup)
+    write(path, {"v": 2}, 2_000_000_000)
+    assert not manager.slots["m"].reload()
+    assert manager.get("m") == {"v": 1}
+    assert "columns mismatch" in manager.status()["m"]["last_error"]
@@ -0,0 +1,63 @@
+import pickle
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("catboost")
+pytest.importorskip("sklearn")
+
+import feature_engineering
+import priority_train
+from priority_train import dump_atomic, featurize_chunk, read_chunks
+
+NOW = pd.Timestamp("2025-09-12", tz="UTC")
+
+
+@pytest.fixture(autouse=True)
+def no_geo_index(monkeypatch):
+    monkeypatch.setattr(feature_engineering, "get_geo_index", lambda: None)
+
+
+@pytest.fixture
+def reports_csv(tmp_path):
+    path = tmp_path / "reports.csv"
+    pd.DataFrame({
+        "id": [1, 1, 2],
+        "category": ["pothole", "pothole", "garbage"],
+        "report_count": [12, 12, 1],
+        "lat": [28.61, 28.61, 28.62],
+        "lon": [77.23, 77.23, 77.21],
+        "report_time": ["2025-09-10 14:30:00", "2025-09-10 14:30:00", "2025-09-11 08:00:00"],
+        "urgency_high_prob": [0.8, 0.8, 0.1],
+        "description": ["deep pothole", "deep pothole", "bins full"],
+    }).to_csv(path, index=False)
+    return str(path)
+
+
+def test_repeated_ids_keep_one_row_per_report(reports_csv):
+    chunks = list(read_chunks(reports_csv, None, chunk_rows=10))
+    features = featurize_chunk(chunks[0], NOW)
+    assert len(features) == 3
+    assert features["urgency_score"].tolist() == [0.8, 0.8, 0.1]
+    assert features["priority"].tolist() == ["High", "High", "Low"]
+
+
+def test_extra_export_columns_are_not_features(reports_csv):
+    chunk = next(read_chunks(reports_csv, None, chunk_rows=10))
+    assert set(chunk.columns) <= set(priority_train.REPORT_COLUMNS)
+    assert "description" not in featurize_chunk(chunk, NOW).columns
+
+
+def test_urgency_table_overrides_the_export(reports_csv):
+    urgency = pd.Series([0.2, 0.9], index=pd.Index([1, 2], name="id"))
+    chunk = next(read_chunks(reports_csv, urgency, chunk_rows=10))
+    assert chunk["urgency_high_prob"].tolist() == [0.2, 0.2, 0.9]
+
+
+def test_dump_atomic_replaces_in_place(tmp_path):
+    path = str(tmp_path / "columns.pkl")
+    dump_atomic(["a"], path)
+    dump_atomic(["a", "b"], path)
+    with open(path, "rb") as f:
+        assert pickle.load(f) == ["a", "b"]
+    assert [p.name for p in tmp_path.iterdir()] == ["columns.pkl"]
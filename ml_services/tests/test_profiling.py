@@ -0,0 +1,67 @@
+import os
+import random
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import profiling
+from profiling import ProfilingMiddleware, profiled
+
+
+@pytest.fixture
+def profile_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling, "PROFILE_KEEP", 3)
+    yield tmp_path
+    profiling.set_sample_rate(0)
+
+
+@pytest.fixture
+def client(profile_dir):
+    app = FastAPI()
+    app.add_middleware(ProfilingMiddleware)
+
+    @app.get("/work")
+    @profiled
+    def work():
+        return {"total": sum(range(1000))}
+
+    return TestClient(app)
+
+
+def test_ring_buffer_keeps_the_newest_profiles(client, profile_dir):
+    ids = [client.get("/work", headers={"X-Profile": "1"}).headers["X-Profile-Id"] for _ in range(5)]
+    assert sorted(os.listdir(profile_dir)) == ids[-3:]
+    assert [p["id"] for p in profiling.list_profiles()] == ids[:-4:-1]
+    assert profiling.profile_path(ids[-1], "python.txt") is not None
+    assert profiling.profile_path(ids[0], "python.txt") is None
+
+
+def test_unprofiled_requests_get_no_header(client, profile_dir):
+    response = client.get("/work")
+    assert response.json() == {"total": 499500}
+    assert "X-Profile-Id" not in response.headers
+    assert os.listdir(profile_dir) == []
+
+
+def test_busy_profiler_is_reported_without_a_profile_id(client):
+    with profiling._session:
+        response = client.get("/work", headers={"X-Profile": "1"})
+    assert response.status_code == 200
+    assert "X-Profile-Id" not in response.headers
+    assert response.headers["X-Profile-Skipped"] == "busy"
+
+
+def test_sample_rate_is_clamped_and_applied(profile_dir):
+    assert profiling.set_sample_rate(5) == 1.0
+    assert profiling.set_sample_rate(-1) == 0.0
+    assert profiling.begin_request({}) is None
+    assert profiling.begin_request({"X-Profile": "1"}) is not None
+
+    random.seed(0)
+    profiling.set_sample_rate(0.25)
+    picked = sum(profiling.begin_request({}) is not None for _ in range(4000))
+    assert 800 < picked < 1200
+    profiling.set_sample_rate(1)
+    assert profiling.begin_request({}) is not None
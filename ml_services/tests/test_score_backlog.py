@@ -0,0 +1,52 @@
+import os
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("joblib")
+pytest.importorskip("sklearn")
+
+from score_backlog import MANIFEST, load_manifest, remaining_chunks, save_manifest, write_part
+
+EXPECTED = {"input": "/data/reports.csv", "input_version": "abc", "chunk_rows": 2, "model_version": "m1", "cascade_threshold": None}
+
+
+@pytest.fixture
+def reports_csv(tmp_path):
+    path = tmp_path / "reports.csv"
+    pd.DataFrame({"id": range(7), "text": "pothole", "lat": 28.61, "lon": 77.23}).to_csv(path, index=False)
+    return str(path)
+
+
+def test_resume_skips_finished_chunks(tmp_path, reports_csv):
+    out = tmp_path / "scores"
+    out.mkdir()
+    manifest = load_manifest(str(out), EXPECTED, restart=False)
+    for index, chunk in remaining_chunks(reports_csv, 2, set(manifest["done"])):
+        if index == 2:
+            break  # interrupted
+        write_part(str(out), index, chunk)
+        manifest["done"].append(index)
+        manifest["rows"] += len(chunk)
+        save_manifest(str(out), manifest)
+
+    resumed = load_manifest(str(out), EXPECTED, restart=False)
+    assert resumed["done"] == [0, 1] and resumed["rows"] == 4
+    todo = list(remaining_chunks(reports_csv, 2, set(resumed["done"])))
+    assert [index for index, _ in todo] == [2, 3]
+    assert todo[0][1]["id"].tolist() == [4, 5]
+    assert todo[1][1]["id"].tolist() == [6]
+
+
+def test_manifest_from_other_models_is_refused(tmp_path):
+    save_manifest(str(tmp_path), {**EXPECTED, "done": [0], "rows": 2})
+    with pytest.raises(SystemExit, match="model_version"):
+        load_manifest(str(tmp_path), {**EXPECTED, "model_version": "m2"}, restart=False)
+
+
+def test_restart_drops_old_parts(tmp_path):
+    write_part(str(tmp_path), 0, pd.DataFrame({"id": [1]}))
+    save_manifest(str(tmp_path), {**EXPECTED, "done": [0], "rows": 1})
+    manifest = load_manifest(str(tmp_path), EXPECTED, restart=True)
+    assert manifest["done"] == [] and manifest["rows"] == 0
+    assert sorted(os.listdir(tmp_path)) == [MANIFEST]
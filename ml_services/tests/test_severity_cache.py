@@ -0,0 +1,92 @@
+import threading
+
+from severity_cache import SeverityCache, normalize_text
+
+RESULT = {"urgency": "high", "urgency_probs": {"high": 0.9, "low": 0.1}}
+
+
+class Model:
+    def __init__(self, version="v1"):
+        self.version = version
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, text):
+        with self._lock:
+            self.calls += 1
+        return {"urgency": "high", "urgency_probs": dict(RESULT["urgency_probs"]), "text": text}, self.version
+
+
+def test_normalized_text_hits_the_cache():
+    cache, model = SeverityCache(shared_path=None), Model()
+    first, version = cache.get_or_compute("Pothole near school!", "v1", model)
+    second, _ = cache.get_or_compute("  pothole NEAR school ", "v1", model)
+    assert normalize_text("Pothole near school!") == "pothole near school"
+    assert model.calls == 1
+    assert second == first and version == "v1"
+    assert cache.metrics()["memory_hits"] == 1
+
+
+def test_results_are_copies():
+    cache, model = SeverityCache(shared_path=None), Model()
+    first, _ = cache.get_or_compute("pothole", "v1", model)
+    first["urgency_probs"]["high"] = 0.0
+    second, _ = cache.get_or_compute("pothole", "v1", model)
+    assert second["urgency_probs"]["high"] == 0.9
+
+
+def test_new_version_invalidates_old_entries():
+    cache = SeverityCache(shared_path=None)
+    cache.get_or_compute("pothole", "v1", Model("v1"))
+    model = Model("v2")
+    cache.get_or_compute("pothole", "v2", model)
+    assert model.calls == 1
+    assert cache.metrics()["invalidations"] == 1
+
+
+def test_result_is_stored_under_the_version_that_computed_it():
+    # the lookup saw v1, but v2 was swapped in before the forward pass
+    cache, model = SeverityCache(shared_path=None), Model("v2")
+    _, version = cache.get_or_compute("pothole", "v1", model)
+    assert version == "v2"
+    _, version = cache.get_or_compute("pothole", "v2", Model("v2"))
+    assert version == "v2"
+    assert cache.metrics()["memory_hits"] == 1
+    assert cache.metrics()["model_version"] == "v2"
+
+
+def test_lru_eviction():
+    cache, model = SeverityCache(shared_path=None, max_entries=2), Model()
+    for text in ("a", "b", "c"):
+        cache.get_or_compute(text, "v1", model)
+    cache.get_or_compute("a", "v1", model)
+    assert model.calls == 4
+    assert cache.metrics()["evictions"] == 2
+
+
+def test_shared_tier_is_seen_by_other_instances(tmp_path):
+    path = str(tmp_path / "cache.db")
+    model = Model()
+    SeverityCache(shared_path=path).get_or_compute("pothole", "v1", model)
+    other = SeverityCache(shared_path=path)
+    result, _ = other.get_or_compute("Pothole.", "v1", model)
+    assert model.calls == 1
+    assert result["urgency"] == "high"
+    assert other.metrics()["shared_hits"] == 1
+
+
+def test_counters_are_exact_under_concurrent_lookups():
+    cache, model = SeverityCache(shared_path=None, max_entries=8), Model()
+
+    def worker(n):
+        for i in range(500):
+            cache.get_or_compute(f"report {(n * 7 + i) % 20}", "v1", model)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    metrics = cache.metrics()
+    assert metrics["memory_hits"] + metrics["misses"] == 8 * 500
+    assert metrics["misses"] == model.calls
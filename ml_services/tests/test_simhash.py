@@ -0,0 +1,43 @@
+import numpy as np
+
+from simhash import LSH_BANDS, MAX_HAMMING, SIMHASH_BITS, SimHashLSH, bands, hamming, simhash, simhash_many
+
+BAND_BITS = SIMHASH_BITS // LSH_BANDS
+
+
+def flip(sig, bits):
+    for b in bits:
+        sig = np.uint64(sig) ^ np.uint64(1 << b)
+    return np.uint64(sig)
+
+
+def test_simhash_ignores_case_and_punctuation():
+    assert simhash("Garbage not collected near the school!") == simhash("garbage not collected, near the school")
+    assert simhash("") == 0
+    assert hamming(simhash("pothole on main road"), [simhash("streetlight broken since last week")])[0] > MAX_HAMMING
+
+
+def test_bands_split_the_signature():
+    sig = simhash("pothole on main road")
+    parts = bands([sig])[0]
+    assert len(parts) == LSH_BANDS
+    rebuilt = sum(int(p) << (BAND_BITS * i) for i, p in enumerate(parts))
+    assert rebuilt == int(sig)
+
+
+def test_lsh_finds_every_signature_within_max_hamming():
+    rng = np.random.default_rng(0)
+    base = np.uint64(rng.integers(0, 2**63, dtype=np.int64)) | np.uint64(1 << 63)
+    # MAX_HAMMING flips spread over different bands still leave one band intact
+    near = flip(base, [band * BAND_BITS + 3 for band in range(MAX_HAMMING)])
+    far = flip(base, [band * BAND_BITS + 3 for band in range(LSH_BANDS)])
+    noise = np.array([np.uint64(x) for x in rng.integers(0, 2**63, size=50, dtype=np.int64)], dtype=np.uint64)
+    table = SimHashLSH(np.concatenate([noise, [near, far, base]]).astype(np.uint64))
+
+    found = set(table.candidates(base).tolist())
+    assert {50, 52} <= found  # near and exact copy
+    assert 51 not in found    # 4 differing bits is over the threshold
+
+
+def test_empty_table():
+    assert len(SimHashLSH(simhash_many([])).candidates(simhash("anything"))) == 0
@@ -0,0 +1,75 @@
+from typing import List
+
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+import wire
+from wire import JSON_TYPE, NDJSON_TYPE, NegotiatedResponse, NegotiatedRoute, ndjson_response
+
+MSGPACK = "application/msgpack"
+needs_msgpack = pytest.mark.skipif(wire.msgpack is None, reason="msgpack not installed")
+
+
+class Item(BaseModel):
+    text: str
+    values: List[float] = []
+
+
+@pytest.fixture
+def client():
+    app = FastAPI(default_response_class=NegotiatedResponse)
+    app.router.route_class = NegotiatedRoute
+
+    @app.post("/echo")
+    def echo(item: Item):
+        return {"text": item.text, "total": float(np.sum(item.values))}
+
+    @app.post("/stream")
+    def stream(items: List[Item]):
+        return ndjson_response({"index": i, "text": item.text} for i, item in enumerate(items))
+
+    return TestClient(app)
+
+
+def test_negotiate():
+    assert wire.negotiate(None) == JSON_TYPE
+    assert wire.negotiate("text/html, */*") == JSON_TYPE
+    expected = MSGPACK if wire.msgpack is not None else JSON_TYPE
+    assert wire.negotiate("application/json;q=0.5, application/msgpack") == expected
+
+
+def test_encode_handles_numpy():
+    body = wire.encode({"a": np.float32(1.5), "b": np.arange(3)})
+    assert wire.decode(body) == {"a": 1.5, "b": [0, 1, 2]}
+
+
+def test_json_request_and_response(client):
+    r = client.post("/echo", json={"text": "pothole", "values": [1, 2]})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith(JSON_TYPE)
+    assert r.json() == {"text": "pothole", "total": 3.0}
+
+
+@needs_msgpack
+def test_msgpack_request_and_response(client):
+    body = wire.encode({"text": "pothole", "values": [1.5]}, MSGPACK)
+    r = client.post("/echo", content=body, headers={"Content-Type": MSGPACK, "Accept": MSGPACK})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith(MSGPACK)
+    assert wire.decode(r.content, MSGPACK) == {"text": "pothole", "total": 1.5}
+
+
+@needs_msgpack
+def test_msgpack_validation_errors_still_422(client):
+    r = client.post("/echo", content=wire.encode({"values": [1]}, MSGPACK), headers={"Content-Type": MSGPACK})
+    assert r.status_code == 422
+
+
+def test_ndjson_stream(client):
+    r = client.post("/stream", json=[{"text": "a"}, {"text": "b"}])
+    assert r.headers["content-type"].startswith(NDJSON_TYPE)
+    lines = [wire.decode(line) for line in r.content.splitlines()]
+    assert lines == [{"index": 0, "text": "a"}, {"index": 1, "text": "b"}]
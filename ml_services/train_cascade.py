@@ -0,0 +1,109 @@
+# Trains the lightweight first stage of the severity cascade (see cascade.py):
+# a linear model over hashed word n-grams for category and urgency, trained on
+# the same data and split as train_multitask_distilbert.py.
+#
+# Usage: python train_cascade.py [--threshold 0.85] [--compare-distilbert]
+import argparse
+import os
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import train_test_split
+
+SEED = 42
+script_dir = os.path.dirname(os.path.abspath(__file__))
+DATA_PATH = os.path.join(script_dir, "data", "data.csv")
+CASCADE_MODEL_PATH = os.path.join(script_dir, "model", "cascade_model.pkl")
+
+VECTORIZER_PARAMS = {
+    "ngram_range": (1, 2),
+    "n_features": 2 ** 18,
+    "alternate_sign": False,
+    "norm": "l2",
+}
+
+def make_vectorizer(params=None):
+    # Stateless, so only its parameters need to be stored with the model
+    return HashingVectorizer(**(params if params is not None else VECTORIZER_PARAMS))
+
+def fit_head(X, y):
+    clf = LogisticRegression(max_iter=1000, C=10.0, class_weight="balanced")
+    clf.fit(X, y)
+    return clf
+
+def cascade_table(cat_conf, urg_conf, light_ok, heavy_ok=None, thresholds=(0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95)):
+    """Escalation rate and accuracy for a sweep of confidence thresholds."""
+    rows = []
+    for t in thresholds:
+        confident = (cat_conf >= t) & (urg_conf >= t)
+        row = {
+            "threshold": t,
+            "escalation_rate": float(1.0 - confident.mean()),
+            "light_accuracy_when_confident": float(light_ok[confident].mean()) if confident.any() else None,
+        }
+        if heavy_ok is not None:
+            row["cascade_accuracy"] = float(np.where(confident, light_ok, heavy_ok).mean())
+            row["distilbert_accuracy"] = float(heavy_ok.mean())
+        rows.append(row)
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the hashed n-gram first stage of the severity cascade")
+    parser.add_argument("--threshold", type=float, default=0.85, help="default confidence threshold stored with the model")
+    parser.add_argument("--compare-distilbert", action="store_true", help="also score the validation split with DistilBERT")
+    args = parser.parse_args()
+
+    print(">>> Loading data...")
+    df = pd.read_csv(DATA_PATH)
+    df = df.dropna(subset=["text", "category", "urgency"]).reset_index(drop=True)
+    # Same split as train_multitask_distilbert.py so the numbers are comparable
+    train_df, val_df = train_test_split(df, test_size=0.2, random_state=SEED, stratify=df["category"])
+
+    vectorizer = make_vectorizer()
+    X_train = vectorizer.transform(train_df["text"].astype(str))
+    X_val = vectorizer.transform(val_df["text"].astype(str))
+
+    print(">>> Training cascade heads...")
+    cat_clf = fit_head(X_train, train_df["category"])
+    urg_clf = fit_head(X_train, train_df["urgency"])
+
+    started = time.perf_counter()
+    cat_proba = cat_clf.predict_proba(X_val)
+    urg_proba = urg_clf.predict_proba(X_val)
+    light_us = 1e6 * (time.perf_counter() - started) / max(len(val_df), 1)
+
+    cat_pred = cat_clf.classes_[cat_proba.argmax(axis=1)]
+    urg_pred = urg_clf.classes_[urg_proba.argmax(axis=1)]
+    light_ok = (cat_pred == val_df["category"].to_numpy()) & (urg_pred == val_df["urgency"].to_numpy())
+    print(f"\n=== Light model (validation, {light_us:.1f}us/report) ===")
+    print(f"Category accuracy: {accuracy_score(val_df['category'], cat_pred):.3f}")
+    print(f"Urgency accuracy:  {accuracy_score(val_df['urgency'], urg_pred):.3f}")
+
+    heavy_ok = None
+    if args.compare_distilbert:
+        from inference import predict_text
+        heavy = [predict_text(t) for t in val_df["text"].astype(str)]
+        heavy_ok = (
+            (np.array([h["category"] for h in heavy]) == val_df["category"].to_numpy())
+            & (np.array([h["urgency"] for h in heavy]) == val_df["urgency"].to_numpy())
+        )
+
+    table = cascade_table(cat_proba.max(axis=1), urg_proba.max(axis=1), light_ok, heavy_ok)
+    print("\n=== Cascade sweep (both heads must be confident) ===")
+    print(pd.DataFrame(table).to_string(index=False))
+
+    os.makedirs(os.path.dirname(CASCADE_MODEL_PATH), exist_ok=True)
+    joblib.dump({
+        "vectorizer_params": VECTORIZER_PARAMS,
+        "cat_clf": cat_clf,
+        "urg_clf": urg_clf,
+        "threshold": args.threshold,
+        "validation": table,
+        "trained_at": time.time(),
+    }, CASCADE_MODEL_PATH)
+    print(f"\n>>> Cascade model saved as {CASCADE_MODEL_PATH}")
@@ -1,5 +1,11 @@
 import os
+import math
+import time
 import random
+import hashlib
+import json
+import glob
+from functools import partial
 import numpy as np
 import pandas as pd
 from sklearn.preprocessing import LabelEncoder
@@ -9,7 +15,7 @@ from sklearn.model_selection import train_test_split
 from tqdm import tqdm
 
 import torch
-from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import Dataset, DataLoader, Sampler, IterableDataset, get_worker_info
 from torch import nn
 from transformers import DistilBertTokenizerFast, DistilBertModel, get_linear_schedule_with_warmup
 from torch.optim import AdamW
@@ -17,17 +23,34 @@ from torch.optim import AdamW
 # -------- Config --------
 MODEL_NAME = "distilbert-base-uncased"
 MAX_LEN = 128
-BATCH_SIZE = 4         # smaller batch for small dataset
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", "4"))    # smaller batch for small dataset
 NUM_EPOCHS = 15        # more epochs
 LR = 2e-5
 WEIGHT_DECAY = 0.01
 PATIENCE = 3           # early stopping patience
+NUM_WORKERS = int(os.getenv("NUM_WORKERS", "0"))  # DataLoader worker processes
+# Throughput mode (CPU retraining): THROUGHPUT_MODE=1 turns on the defaults below,
+# each of which can also be set on its own
+THROUGHPUT_MODE = os.getenv("THROUGHPUT_MODE", "0") == "1"
+GRAD_ACCUM_STEPS = int(os.getenv("GRAD_ACCUM_STEPS", "8" if THROUGHPUT_MODE else "1"))
+USE_BF16 = os.getenv("TRAIN_BF16", "1" if THROUGHPUT_MODE else "0") == "1"
+USE_COMPILE = os.getenv("TORCH_COMPILE", "0") == "1"
+NUM_THREADS = int(os.getenv("NUM_THREADS", str(os.cpu_count() or 1) if THROUGHPUT_MODE else "0"))  # 0 = torch default
+CHECKPOINT_EVERY = int(os.getenv("CHECKPOINT_EVERY", "200" if THROUGHPUT_MODE else "0"))  # optimizer steps, 0 = epoch ends only
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 SEED = 42
 # Get the directory of the current script to make paths relative to it
 script_dir = os.path.dirname(os.path.abspath(__file__))
 OUTPUT_DIR = os.path.join(script_dir, "output_distilbert_multitask")
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+TOKEN_CACHE_DIR = os.path.join(OUTPUT_DIR, "token_cache")
+TRAIN_STATE_PATH = os.path.join(OUTPUT_DIR, "train_state.pth")  # resumable mid-epoch state
+SUMMARY_PATH = os.path.join(OUTPUT_DIR, "training_summary.json")
+# Training data: a CSV, a Parquet file, a directory of .csv/.parquet shards or a glob
+TRAIN_DATA = os.getenv("TRAIN_DATA", os.path.join(script_dir, "data", "data.csv"))
+# STREAM_DATA=1 streams TRAIN_DATA in chunks instead of loading it into memory
+STREAM_DATA = os.getenv("STREAM_DATA", "0") == "1"
+STREAM_CHUNK_ROWS = int(os.getenv("STREAM_CHUNK_ROWS", "10000"))
+VAL_FRACTION = 0.2
 
 # -------- Helpers --------
 def set_seed(seed=SEED):
@@ -36,66 +59,241 @@ def set_seed(seed=SEED):
     torch.manual_seed(seed)
     if torch.cuda.is_available():
         torch.cuda.manual_seed_all(seed)
-set_seed()
 
-# -------- Load data --------
-# Get the directory of the current script to make paths relative to it
-script_dir = os.path.dirname(os.path.abspath(__file__))
-data_path = os.path.join(script_dir, "data", "data.csv")
-df = pd.read_csv(data_path)
-df = df.dropna(subset=["text", "category", "urgency"]).reset_index(drop=True)
-
-# Label encoders
-cat_le = LabelEncoder()
-urg_le = LabelEncoder()
-df["cat_id"] = cat_le.fit_transform(df["category"])
-df["urg_id"] = urg_le.fit_transform(df["urgency"])
-
-num_cat = len(cat_le.classes_)
-num_urg = len(urg_le.classes_)
+# -------- Token cache --------
+def tokenize_corpus(texts, tokenizer, max_len=MAX_LEN, cache_dir=TOKEN_CACHE_DIR, chunk_size=10000):
+    """
+    Tokenize every text once, unpadded, into a flat int32 id array plus offsets.
+    Cached on disk keyed by tokenizer, max length and corpus content, and loaded
+    memory-mapped so DataLoader workers share the pages.
+    Returns (ids, offsets): text i is ids[offsets[i]:offsets[i+1]].
+    """
+    texts = [str(t) for t in texts]
+    digest = hashlib.sha1()
+    digest.update(f"{tokenizer.name_or_path}|{len(tokenizer)}|{max_len}|{len(texts)}".encode())
+    for t in texts:
+        digest.update(t.encode())
+        digest.update(b"\0")
+    path = os.path.join(cache_dir, digest.hexdigest()[:16])
 
-print("Categories:", cat_le.classes_)
-print("Urgency labels:", urg_le.classes_)
+    if not os.path.exists(os.path.join(path, "offsets.npy")):
+        print(f"Tokenizing {len(texts)} texts into {path} ...")
+        ids, lengths = [], []
+        for i in range(0, len(texts), chunk_size):
+            enc = tokenizer(texts[i:i + chunk_size], truncation=True, max_length=max_len, padding=False)
+            for row in enc["input_ids"]:
+                ids.append(np.asarray(row, dtype=np.int32))
+                lengths.append(len(row))
+        offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(lengths)
+        tmp = path + ".tmp"
+        os.makedirs(tmp, exist_ok=True)
+        np.save(os.path.join(tmp, "ids.npy"), np.concatenate(ids) if ids else np.empty(0, dtype=np.int32))
+        np.save(os.path.join(tmp, "offsets.npy"), offsets)
+        os.replace(tmp, path)
 
-train_df, val_df = train_test_split(
-    df, test_size=0.2, random_state=SEED, stratify=df["category"]
-)
+    return np.load(os.path.join(path, "ids.npy"), mmap_mode="r"), np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
 
 # -------- Dataset class --------
-tokenizer = DistilBertTokenizerFast.from_pretrained(MODEL_NAME)
-
 class CivicTextDataset(Dataset):
-    def __init__(self, texts, cat_ids, urg_ids, tokenizer, max_len=MAX_LEN):
-        self.texts = texts.tolist()
-        self.cat_ids = cat_ids.tolist()
-        self.urg_ids = urg_ids.tolist()
-        self.tokenizer = tokenizer
-        self.max_len = max_len
+    """Pre-tokenized rows of the token cache; padding happens per batch in dynamic_pad_collate."""
+    def __init__(self, token_ids, offsets, rows, cat_ids, urg_ids):
+        self.token_ids = token_ids
+        self.offsets = offsets
+        self.rows = np.asarray(rows)
+        self.cat_ids = np.asarray(cat_ids)
+        self.urg_ids = np.asarray(urg_ids)
 
     def __len__(self):
-        return len(self.texts)
+        return len(self.rows)
+
+    def lengths(self):
+        return (self.offsets[self.rows + 1] - self.offsets[self.rows]).astype(np.int64)
 
     def __getitem__(self, idx):
-        text = str(self.texts[idx])
-        enc = self.tokenizer(
-            text,
-            truncation=True,
-            max_length=self.max_len,
-            padding="max_length",
-            return_tensors="pt"
-        )
+        row = self.rows[idx]
+        ids = self.token_ids[self.offsets[row]:self.offsets[row + 1]]
         return {
-            "input_ids": enc["input_ids"].squeeze(0),
-            "attention_mask": enc["attention_mask"].squeeze(0),
+            "input_ids": torch.from_numpy(np.array(ids, dtype=np.int64)),
             "cat_id": torch.tensor(self.cat_ids[idx], dtype=torch.long),
             "urg_id": torch.tensor(self.urg_ids[idx], dtype=torch.long)
         }
 
-train_dataset = CivicTextDataset(train_df["text"], train_df["cat_id"], train_df["urg_id"], tokenizer)
-val_dataset = CivicTextDataset(val_df["text"], val_df["cat_id"], val_df["urg_id"], tokenizer)
+class LengthBucketSampler(Sampler):
+    """
+    Batches of similar length: shuffle, sort inside pools of batch_size * pool_batches
+    items by length, cut into batches, then shuffle the batches. Padding per batch
+    then stays close to the real sequence lengths.
+    """
+    def __init__(self, lengths, batch_size, shuffle=True, pool_batches=50, seed=SEED):
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.pool_size = batch_size * pool_batches
+        self.seed = seed
+        self.epoch = 0
+        self.start_batch = 0
+
+    def set_epoch(self, epoch, start_batch=0):
+        """Batch order depends only on (seed, epoch), so a resumed run can skip start_batch batches."""
+        self.epoch = epoch
+        self.start_batch = start_batch
+
+    def batches(self):
+        rng = np.random.default_rng(self.seed + self.epoch)
+        order = rng.permutation(len(self.lengths)) if self.shuffle else np.arange(len(self.lengths))
+        batches = []
+        for start in range(0, len(order), self.pool_size):
+            pool = order[start:start + self.pool_size]
+            pool = pool[np.argsort(self.lengths[pool], kind="stable")]
+            batches.extend(pool[i:i + self.batch_size].tolist() for i in range(0, len(pool), self.batch_size))
+        if self.shuffle:
+            batches = [batches[i] for i in rng.permutation(len(batches))]
+        return batches
+
+    def __iter__(self):
+        return iter(self.batches()[self.start_batch:])
+
+    def __len__(self):
+        return (len(self.lengths) + self.batch_size - 1) // self.batch_size - self.start_batch
+
+def dynamic_pad_collate(batch, pad_id=0):
+    max_len = max(len(item["input_ids"]) for item in batch)
+    input_ids = torch.full((len(batch), max_len), pad_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(batch), max_len), dtype=torch.long)
+    for i, item in enumerate(batch):
+        n = len(item["input_ids"])
+        input_ids[i, :n] = item["input_ids"]
+        attention_mask[i, :n] = 1
+    return {
+        "input_ids": input_ids,
+        "attention_mask": attention_mask,
+        "cat_id": torch.stack([item["cat_id"] for item in batch]),
+        "urg_id": torch.stack([item["urg_id"] for item in batch])
+    }
+
+# -------- Streaming dataset --------
+def resolve_shards(source=TRAIN_DATA):
+    """Sorted list of .csv/.parquet files for a file, directory or glob."""
+    if os.path.isdir(source):
+        paths = glob.glob(os.path.join(source, "*.csv")) + glob.glob(os.path.join(source, "*.parquet"))
+    else:
+        paths = glob.glob(source)
+    if not paths:
+        raise FileNotFoundError(f"No training data found at {source}")
+    return sorted(paths)
+
+def iter_chunks(paths, chunk_rows=STREAM_CHUNK_ROWS, columns=("text", "category", "urgency")):
+    """Yield DataFrame chunks of at most chunk_rows rows, shard by shard, without loading whole files."""
+    for path in paths:
+        if path.endswith(".parquet"):
+            import pyarrow.parquet as pq
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows, columns=list(columns)):
+                yield batch.to_pandas()
+        else:
+            yield from pd.read_csv(path, usecols=list(columns), chunksize=chunk_rows)
+
+def is_validation(texts, fraction=VAL_FRACTION):
+    """Deterministic split on a fixed-key hash of the text: same row, same side, on every pass and machine."""
+    h = pd.util.hash_pandas_object(pd.Series(texts, dtype=str), index=False).to_numpy()
+    return (h % 10000) < int(fraction * 10000)
+
+def build_label_vocab(paths, chunk_rows=STREAM_CHUNK_ROWS, batch_size=BATCH_SIZE):
+    """
+    First streaming pass: label vocabularies (sorted, as LabelEncoder would), train/val
+    row counts, train label counts for class weights, and the exact number of train
+    batches per epoch (each chunk ends in its own partial batch) for the LR schedule.
+    """
+    cat_counts, urg_counts = {}, {}
+    categories, urgencies = set(), set()
+    n_train = n_val = train_batches = 0
+    for chunk in iter_chunks(paths, chunk_rows):
+        chunk = chunk.dropna(subset=["text", "category", "urgency"])
+        categories.update(chunk["category"].astype(str).unique())
+        urgencies.update(chunk["urgency"].astype(str).unique())
+        val = is_validation(chunk["text"])
+        n_val += int(val.sum())
+        train = chunk[~val]
+        n_train += len(train)
+        train_batches += math.ceil(len(train) / batch_size)
+        for counts, col in ((cat_counts, "category"), (urg_counts, "urgency")):
+            for label, n in train[col].astype(str).value_counts().items():
+                counts[label] = counts.get(label, 0) + int(n)
+    return {
+        "categories": sorted(categories),
+        "urgencies": sorted(urgencies),
+        "cat_counts": cat_counts,
+        "urg_counts": urg_counts,
+        "n_train": n_train,
+        "n_val": n_val,
+        "train_batches": train_batches,
+    }
+
+def balanced_weights(counts, classes):
+    """Same formula as compute_class_weight("balanced"), from streamed counts."""
+    total = sum(counts.values())
+    return np.array([total / (len(classes) * max(counts.get(c, 0), 1)) for c in classes], dtype=np.float64)
+
+class StreamingCivicDataset(IterableDataset):
+    """
+    Streams one split of the training data chunk by chunk: tokenizes each chunk,
+    forms length-bucketed batches inside it and yields them already padded (use with
+    DataLoader(batch_size=None)). Chunks are spread round-robin over DataLoader workers.
+    Peak memory is a few chunks per worker, independent of dataset size.
+    """
+    def __init__(self, paths, split, vocab, tokenizer, max_len=MAX_LEN, batch_size=BATCH_SIZE,
+                 chunk_rows=STREAM_CHUNK_ROWS, shuffle=True, seed=SEED):
+        self.paths = paths
+        self.split = split
+        self.cat_index = {c: i for i, c in enumerate(vocab["categories"])}
+        self.urg_index = {u: i for i, u in enumerate(vocab["urgencies"])}
+        self.tokenizer = tokenizer
+        self.max_len = max_len
+        self.batch_size = batch_size
+        self.chunk_rows = chunk_rows
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+        self.start_batch = 0
+
+    def set_epoch(self, epoch, start_batch=0):
+        """start_batch is skipped exactly with NUM_WORKERS <= 1, approximately (per worker) otherwise."""
+        self.epoch = epoch
+        self.start_batch = start_batch
+
+    def __iter__(self):
+        worker = get_worker_info()
+        worker_id, num_workers = (worker.id, worker.num_workers) if worker else (0, 1)
+        paths = list(self.paths)
+        if self.shuffle:
+            np.random.default_rng(self.seed + self.epoch).shuffle(paths)
+        skip = self.start_batch // num_workers
+
+        for i, chunk in enumerate(iter_chunks(paths, self.chunk_rows)):
+            if i % num_workers != worker_id:
+                continue
+            chunk = chunk.dropna(subset=["text", "category", "urgency"])
+            val = is_validation(chunk["text"])
+            chunk = chunk[val if self.split == "val" else ~val]
+            if chunk.empty:
+                continue
+            enc = self.tokenizer(chunk["text"].astype(str).tolist(), truncation=True, max_length=self.max_len, padding=False)
+            ids = [np.asarray(row, dtype=np.int64) for row in enc["input_ids"]]
+            cat_ids = chunk["category"].astype(str).map(self.cat_index).to_numpy()
+            urg_ids = chunk["urgency"].astype(str).map(self.urg_index).to_numpy()
+
+            sampler = LengthBucketSampler([len(x) for x in ids], self.batch_size, shuffle=self.shuffle, seed=self.seed + i)
+            sampler.set_epoch(self.epoch)
+            for batch in sampler.batches():
+                if skip:
+                    skip -= 1
+                    continue
+                yield dynamic_pad_collate([{
+                    "input_ids": torch.from_numpy(ids[j]),
+                    "cat_id": torch.tensor(cat_ids[j], dtype=torch.long),
+                    "urg_id": torch.tensor(urg_ids[j], dtype=torch.long),
+                } for j in batch], self.tokenizer.pad_token_id)
 
-train_loader = DataLoader(train_dataset, batch_size=BATCH_SIZE, shuffle=True)
-val_loader = DataLoader(val_dataset, batch_size=BATCH_SIZE, shuffle=False)
 
 # -------- Model --------
 class DistilBertMultiTask(nn.Module):
@@ -107,73 +305,236 @@ class DistilBertMultiTask(nn.Module):
         self.cat_classifier = nn.Linear(hidden_size, num_cat)
         self.urg_classifier = nn.Linear(hidden_size, num_urg)
 
-    def forward(self, input_ids, attention_mask):
+    def forward(self, input_ids, attention_mask, return_embedding=False):
         out = self.backbone(input_ids=input_ids, attention_mask=attention_mask)
         hidden = out.last_hidden_state[:,0,:]  # CLS-like
         hidden = self.dropout(hidden)
-        return self.cat_classifier(hidden), self.urg_classifier(hidden)
-
-model = DistilBertMultiTask(MODEL_NAME, num_cat=num_cat, num_urg=num_urg).to(DEVICE)
-
-# -------- Optimizer & Scheduler --------
-no_decay = ["bias", "LayerNorm.weight"]
-optimizer_grouped_parameters = [
-    {
-        "params": [p for n,p in model.named_parameters() if not any(nd in n for nd in no_decay)],
-        "weight_decay": WEIGHT_DECAY
-    },
-    {
-        "params": [p for n,p in model.named_parameters() if any(nd in n for nd in no_decay)],
-        "weight_decay": 0.0
-    }
-]
-optimizer = AdamW(optimizer_grouped_parameters, lr=LR)
-total_steps = len(train_loader) * NUM_EPOCHS
-scheduler = get_linear_schedule_with_warmup(
-    optimizer, num_warmup_steps=int(0.06*total_steps), num_training_steps=total_steps
-)
-
-# -------- Loss with class weights --------
-cat_weights = compute_class_weight("balanced", classes=np.unique(df["cat_id"]), y=df["cat_id"])
-urg_weights = compute_class_weight("balanced", classes=np.unique(df["urg_id"]), y=df["urg_id"])
-cat_loss_fn = nn.CrossEntropyLoss(weight=torch.tensor(cat_weights, dtype=torch.float).to(DEVICE))
-urg_loss_fn = nn.CrossEntropyLoss(weight=torch.tensor(urg_weights, dtype=torch.float).to(DEVICE))
-
-# -------- Training loop with early stopping --------
-# Check if model already exists
-model_path = os.path.join(OUTPUT_DIR, "best_model.pth")
-if os.path.exists(model_path):
-    print("Model already exists. Skipping training.")
-else:
-    print("Starting training...")
+        cat_logits, urg_logits = self.cat_classifier(hidden), self.urg_classifier(hidden)
+        if not return_embedding:
+            return cat_logits, urg_logits
+        # Mean-pooled sentence embedding from the same forward pass (used for duplicate detection)
+        mask = attention_mask.unsqueeze(-1).to(out.last_hidden_state.dtype)
+        pooled = (out.last_hidden_state * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+        return cat_logits, urg_logits, pooled
+
+def make_loader(dataset, shuffle, pad_id):
+    return DataLoader(
+        dataset,
+        batch_sampler=LengthBucketSampler(dataset.lengths(), BATCH_SIZE, shuffle=shuffle),
+        collate_fn=partial(dynamic_pad_collate, pad_id=pad_id),
+        num_workers=NUM_WORKERS,
+        persistent_workers=NUM_WORKERS > 0,
+    )
+
+def main():
+    set_seed()
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    if STREAM_DATA:
+        return main_streaming()
+
+    # -------- Load data --------
+    df = pd.concat([pd.read_parquet(p) if p.endswith(".parquet") else pd.read_csv(p) for p in resolve_shards()], ignore_index=True)
+    df = df.dropna(subset=["text", "category", "urgency"]).reset_index(drop=True)
+
+    # Label encoders
+    cat_le = LabelEncoder()
+    urg_le = LabelEncoder()
+    df["cat_id"] = cat_le.fit_transform(df["category"])
+    df["urg_id"] = urg_le.fit_transform(df["urgency"])
+
+    num_cat = len(cat_le.classes_)
+    num_urg = len(urg_le.classes_)
+
+    print("Categories:", cat_le.classes_)
+    print("Urgency labels:", urg_le.classes_)
+
+    train_df, val_df = train_test_split(
+        df, test_size=0.2, random_state=SEED, stratify=df["category"]
+    )
+
+    # -------- Tokenize once --------
+    tokenizer = DistilBertTokenizerFast.from_pretrained(MODEL_NAME)
+    token_ids, offsets = tokenize_corpus(df["text"], tokenizer)
+
+    train_dataset = CivicTextDataset(token_ids, offsets, train_df.index, train_df["cat_id"], train_df["urg_id"])
+    val_dataset = CivicTextDataset(token_ids, offsets, val_df.index, val_df["cat_id"], val_df["urg_id"])
+
+    train_loader = make_loader(train_dataset, shuffle=True, pad_id=tokenizer.pad_token_id)
+    val_loader = make_loader(val_dataset, shuffle=False, pad_id=tokenizer.pad_token_id)
+
+    model = DistilBertMultiTask(MODEL_NAME, num_cat=num_cat, num_urg=num_urg).to(DEVICE)
+
+    # -------- Loss with class weights --------
+    cat_weights = compute_class_weight("balanced", classes=np.unique(df["cat_id"]), y=df["cat_id"])
+    urg_weights = compute_class_weight("balanced", classes=np.unique(df["urg_id"]), y=df["urg_id"])
+
+    train(
+        model, train_loader, val_loader, len(train_loader), cat_weights, urg_weights,
+        checkpoint_extra={
+            "cat_le_classes": cat_le.classes_.tolist(),
+            "urg_le_classes": urg_le.classes_.tolist()
+        },
+        tokenizer=tokenizer,
+    )
+
+def main_streaming():
+    """Out-of-core variant of main(): two streaming passes, nothing proportional to the dataset kept in memory."""
+    paths = resolve_shards()
+    print(f"Streaming {len(paths)} shard(s) in chunks of {STREAM_CHUNK_ROWS} rows...")
+    vocab = build_label_vocab(paths)
+    print("Categories:", vocab["categories"])
+    print("Urgency labels:", vocab["urgencies"])
+    print(f"Train rows: {vocab['n_train']} ({vocab['train_batches']} batches/epoch) | Val rows: {vocab['n_val']}")
+
+    tokenizer = DistilBertTokenizerFast.from_pretrained(MODEL_NAME)
+
+    def loader(split, shuffle):
+        dataset = StreamingCivicDataset(paths, split, vocab, tokenizer, shuffle=shuffle)
+        # not persistent: workers must pick up set_epoch() each epoch
+        return DataLoader(dataset, batch_size=None, num_workers=NUM_WORKERS)
+
+    model = DistilBertMultiTask(MODEL_NAME, num_cat=len(vocab["categories"]), num_urg=len(vocab["urgencies"])).to(DEVICE)
+
+    train(
+        model, loader("train", True), loader("val", False),
+        vocab["train_batches"],
+        balanced_weights(vocab["cat_counts"], vocab["categories"]),
+        balanced_weights(vocab["urg_counts"], vocab["urgencies"]),
+        checkpoint_extra={
+            "cat_le_classes": vocab["categories"],
+            "urg_le_classes": vocab["urgencies"]
+        },
+        tokenizer=tokenizer,
+    )
+
+def save_train_state(model, optimizer, scheduler, epoch, batches_done, best_val_f1, patience_counter,
+                     epoch_stats, epoch_samples=0, epoch_seconds=0.0):
+    """epoch_stats and the partial epoch's samples/seconds let a resumed run report all its epochs."""
+    tmp = TRAIN_STATE_PATH + ".tmp"
+    torch.save({
+        "model_state_dict": model.state_dict(),
+        "optimizer_state_dict": optimizer.state_dict(),
+        "scheduler_state_dict": scheduler.state_dict(),
+        "epoch": epoch,
+        "batches_done": batches_done,
+        "best_val_f1": best_val_f1,
+        "patience_counter": patience_counter,
+        "epoch_stats": epoch_stats,
+        "epoch_samples": epoch_samples,
+        "epoch_seconds": epoch_seconds,
+        "torch_rng_state": torch.get_rng_state(),
+    }, tmp)
+    os.replace(tmp, TRAIN_STATE_PATH)
+
+def train(model, train_loader, val_loader, batches_per_epoch, cat_weights, urg_weights, checkpoint_extra, tokenizer):
+    """
+    Training loop with early stopping. Supports gradient accumulation, bf16 autocast,
+    torch.compile and resuming from train_state.pth (saved every CHECKPOINT_EVERY
+    optimizer steps and at each epoch end).
+    """
+    if NUM_THREADS > 0:
+        torch.set_num_threads(NUM_THREADS)
+
+    # -------- Optimizer & Scheduler --------
+    no_decay = ["bias", "LayerNorm.weight"]
+    optimizer_grouped_parameters = [
+        {
+            "params": [p for n,p in model.named_parameters() if not any(nd in n for nd in no_decay)],
+            "weight_decay": WEIGHT_DECAY
+        },
+        {
+            "params": [p for n,p in model.named_parameters() if any(nd in n for nd in no_decay)],
+            "weight_decay": 0.0
+        }
+    ]
+    optimizer = AdamW(optimizer_grouped_parameters, lr=LR)
+    # batches_per_epoch may be an estimate (streaming mode); it only shapes the LR schedule
+    total_steps = math.ceil(batches_per_epoch / GRAD_ACCUM_STEPS) * NUM_EPOCHS
+    scheduler = get_linear_schedule_with_warmup(
+        optimizer, num_warmup_steps=int(0.06*total_steps), num_training_steps=total_steps
+    )
+
+    def optimizer_step():
+        torch.nn.utils.clip_grad_norm_(model.parameters(), 1.0)
+        optimizer.step()
+        scheduler.step()
+        optimizer.zero_grad()
+
+    cat_loss_fn = nn.CrossEntropyLoss(weight=torch.tensor(cat_weights, dtype=torch.float).to(DEVICE))
+    urg_loss_fn = nn.CrossEntropyLoss(weight=torch.tensor(urg_weights, dtype=torch.float).to(DEVICE))
+
+    # -------- Training loop with early stopping --------
+    # Check if model already exists
+    model_path = os.path.join(OUTPUT_DIR, "best_model.pth")
+    start_epoch, start_batch = 0, 0
     best_val_f1 = 0
     patience_counter = 0
+    epoch_stats = []
+    resumed_samples, resumed_seconds = 0, 0.0  # progress of the interrupted epoch
+    if os.path.exists(TRAIN_STATE_PATH):
+        state = torch.load(TRAIN_STATE_PATH, map_location=DEVICE)
+        model.load_state_dict(state["model_state_dict"])
+        optimizer.load_state_dict(state["optimizer_state_dict"])
+        scheduler.load_state_dict(state["scheduler_state_dict"])
+        torch.set_rng_state(state["torch_rng_state"])
+        start_epoch, start_batch = state["epoch"], state["batches_done"]
+        best_val_f1, patience_counter = state["best_val_f1"], state["patience_counter"]
+        epoch_stats = state.get("epoch_stats", [])
+        resumed_samples, resumed_seconds = state.get("epoch_samples", 0), state.get("epoch_seconds", 0.0)
+        print(f"Resuming from epoch {start_epoch+1}, batch {start_batch}...")
+    elif os.path.exists(model_path):
+        print("Model already exists. Skipping training.")
+        return
+
+    # compiled forward shares parameters with model; state dicts are always taken from model
+    forward = torch.compile(model) if USE_COMPILE else model
+    print(f"Starting training... (grad_accum={GRAD_ACCUM_STEPS}, bf16={USE_BF16}, compile={USE_COMPILE}, threads={torch.get_num_threads()})")
 
-    for epoch in range(NUM_EPOCHS):
+    for epoch in range(start_epoch, NUM_EPOCHS):
         # Training
         model.train()
+        skip = start_batch if epoch == start_epoch else 0
+        if hasattr(train_loader, "batch_sampler") and hasattr(train_loader.batch_sampler, "set_epoch"):
+            train_loader.batch_sampler.set_epoch(epoch, start_batch=skip)
+        elif hasattr(train_loader.dataset, "set_epoch"):
+            train_loader.dataset.set_epoch(epoch, start_batch=skip)
         train_loss = 0.0
+        samples = resumed_samples if epoch == start_epoch else 0
+        prior_seconds = resumed_seconds if epoch == start_epoch else 0.0
+        batches_done = skip
+        epoch_started = time.perf_counter()
+        optimizer.zero_grad()
         for batch in tqdm(train_loader, desc=f"Train Epoch {epoch+1}"):
-            optimizer.zero_grad()
             input_ids = batch["input_ids"].to(DEVICE)
             attention_mask = batch["attention_mask"].to(DEVICE)
             cat_labels = batch["cat_id"].to(DEVICE)
             urg_labels = batch["urg_id"].to(DEVICE)
 
-            cat_logits, urg_logits = model(input_ids, attention_mask)
-            loss_cat = cat_loss_fn(cat_logits, cat_labels)
-            loss_urg = urg_loss_fn(urg_logits, urg_labels)
+            with torch.autocast(device_type=DEVICE.type, dtype=torch.bfloat16, enabled=USE_BF16):
+                cat_logits, urg_logits = forward(input_ids, attention_mask)
+            loss_cat = cat_loss_fn(cat_logits.float(), cat_labels)
+            loss_urg = urg_loss_fn(urg_logits.float(), urg_labels)
             loss = loss_cat + loss_urg
-            loss.backward()
-            torch.nn.utils.clip_grad_norm_(model.parameters(), 1.0)
-            optimizer.step()
-            scheduler.step()
+            (loss / GRAD_ACCUM_STEPS).backward()
             train_loss += loss.item()
-        avg_train_loss = train_loss / len(train_loader)
+            samples += len(input_ids)
+            batches_done += 1
+
+            if batches_done % GRAD_ACCUM_STEPS == 0:
+                optimizer_step()
+                # checkpoints only land on accumulation boundaries, so no partial gradients are lost
+                if CHECKPOINT_EVERY and (batches_done // GRAD_ACCUM_STEPS) % CHECKPOINT_EVERY == 0:
+                    save_train_state(model, optimizer, scheduler, epoch, batches_done, best_val_f1, patience_counter,
+                                     epoch_stats, samples, prior_seconds + time.perf_counter() - epoch_started)
+        if batches_done % GRAD_ACCUM_STEPS:
+            optimizer_step()  # last partial accumulation of the epoch
+        epoch_s = prior_seconds + time.perf_counter() - epoch_started
+        avg_train_loss = train_loss / max(batches_done - skip, 1)
 
         # Validation
         model.eval()
         val_loss = 0.0
+        val_batches = 0
         all_cat_preds, all_cat_labels = [], []
         all_urg_preds, all_urg_labels = [], []
 
@@ -184,38 +545,65 @@ else:
                 cat_labels = batch["cat_id"].to(DEVICE)
                 urg_labels = batch["urg_id"].to(DEVICE)
 
-                cat_logits, urg_logits = model(input_ids, attention_mask)
+                with torch.autocast(device_type=DEVICE.type, dtype=torch.bfloat16, enabled=USE_BF16):
+                    cat_logits, urg_logits = forward(input_ids, attention_mask)
+                cat_logits, urg_logits = cat_logits.float(), urg_logits.float()
                 loss_cat = cat_loss_fn(cat_logits, cat_labels)
                 loss_urg = urg_loss_fn(urg_logits, urg_labels)
                 loss = loss_cat + loss_urg
                 val_loss += loss.item()
+                val_batches += 1
 
                 all_cat_preds.extend(torch.argmax(cat_logits, dim=1).cpu().numpy())
                 all_cat_labels.extend(cat_labels.cpu().numpy())
                 all_urg_preds.extend(torch.argmax(urg_logits, dim=1).cpu().numpy())
                 all_urg_labels.extend(urg_labels.cpu().numpy())
 
-        avg_val_loss = val_loss / len(val_loader)
+        avg_val_loss = val_loss / max(val_batches, 1)
         cat_f1 = f1_score(all_cat_labels, all_cat_preds, average="macro", zero_division=0)
         urg_f1 = f1_score(all_urg_labels, all_urg_preds, average="macro", zero_division=0)
         avg_f1 = (cat_f1 + urg_f1) / 2
+        samples_per_s = samples / epoch_s if epoch_s > 0 else 0.0
+        epoch_stats.append({"epoch": epoch + 1, "epoch_s": epoch_s, "samples_per_s": samples_per_s, "cat_f1": float(cat_f1), "urg_f1": float(urg_f1)})
 
-        print(f"Epoch {epoch+1} | Train Loss: {avg_train_loss:.4f} | Val Loss: {avg_val_loss:.4f} | Cat F1: {cat_f1:.3f} | Urg F1: {urg_f1:.3f}")
+        print(f"Epoch {epoch+1} | Train Loss: {avg_train_loss:.4f} | Val Loss: {avg_val_loss:.4f} | Cat F1: {cat_f1:.3f} | Urg F1: {urg_f1:.3f} | {epoch_s:.1f}s | {samples_per_s:.1f} samples/s")
 
+        stop = False
         if avg_f1 > best_val_f1:
             best_val_f1 = avg_f1
             patience_counter = 0
             print("Saving best model...")
             torch.save({
                 "model_state_dict": model.state_dict(),
-                "cat_le_classes": cat_le.classes_.tolist(),
-                "urg_le_classes": urg_le.classes_.tolist()
-            }, os.path.join(OUTPUT_DIR, "best_model.pth"))
+                **checkpoint_extra
+            }, model_path)
             tokenizer.save_pretrained(os.path.join(OUTPUT_DIR, "tokenizer"))
         else:
             patience_counter += 1
             if patience_counter >= PATIENCE:
                 print("Early stopping triggered.")
-                break
+                stop = True
+
+        if stop or epoch + 1 == NUM_EPOCHS:
+            break
+        save_train_state(model, optimizer, scheduler, epoch + 1, 0, best_val_f1, patience_counter, epoch_stats)
+
+    if os.path.exists(TRAIN_STATE_PATH):
+        os.remove(TRAIN_STATE_PATH)
+    # Compare runs (e.g. THROUGHPUT_MODE=0 vs 1) through this file
+    with open(SUMMARY_PATH, "w") as f:
+        json.dump({
+            "best_val_f1": best_val_f1,
+            "grad_accum_steps": GRAD_ACCUM_STEPS,
+            "bf16": USE_BF16,
+            "compile": USE_COMPILE,
+            "threads": torch.get_num_threads(),
+            "batch_size": BATCH_SIZE,
+            "epochs": epoch_stats,
+        }, f, indent=2)
+    print(f"Training complete. Best avg F1: {best_val_f1:.3f} (summary in {SUMMARY_PATH})")
 
-    print("Training complete.")
+# Training only runs as a script: inference.py imports DistilBertMultiTask from here,
+# and DataLoader workers re-import this module
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# Content negotiation for the FastAPI apps: request bodies in JSON or MessagePack
+# (Content-Type), responses in whatever the client Accepts, encoded with orjson
+# when it is installed. Batch endpoints stream NDJSON, one result per line.
+#
+#   app = FastAPI(default_response_class=NegotiatedResponse)
+#   app.router.route_class = NegotiatedRoute   # before any route is declared
+import json
+from contextvars import ContextVar
+
+import numpy as np
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.routing import APIRoute
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_TYPE = "application/json"
+NDJSON_TYPE = "application/x-ndjson"
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+_response_type = ContextVar("response_type", default=JSON_TYPE)
+
+
+def _default(obj):
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
+
+def encode(content, media_type=JSON_TYPE):
+    if media_type in MSGPACK_TYPES:
+        return msgpack.packb(content, default=_default, use_bin_type=True)
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+def decode(body, media_type=JSON_TYPE):
+    if media_type in MSGPACK_TYPES:
+        return msgpack.unpackb(body, raw=False)
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+def negotiate(accept):
+    """MessagePack if the client lists it in Accept (and msgpack is installed), JSON otherwise."""
+    if accept and msgpack is not None:
+        for part in accept.split(","):
+            media_type = part.split(";")[0].strip().lower()
+            if media_type in MSGPACK_TYPES:
+                return media_type
+    return JSON_TYPE
+
+
+class NegotiatedResponse(JSONResponse):
+    """Renders with the media type chosen by NegotiatedRoute for the current request."""
+    def __init__(self, content, status_code=200, headers=None, media_type=None, background=None):
+        super().__init__(content, status_code, headers, media_type or _response_type.get(), background)
+
+    def render(self, content):
+        return encode(content, self.media_type)
+
+
+class WireRequest(Request):
+    """Parses the body with decode(); FastAPI sees every supported body as JSON."""
+    def __init__(self, scope, receive, wire_type=JSON_TYPE):
+        super().__init__(scope, receive)
+        self.wire_type = wire_type
+
+    async def json(self):
+        if not hasattr(self, "_json"):
+            self._json = decode(await self.body(), self.wire_type)
+        return self._json
+
+
+class NegotiatedRoute(APIRoute):
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def negotiated_handler(request: Request):
+            scope = request.scope
+            content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+            wire_type = JSON_TYPE
+            if content_type in MSGPACK_TYPES:
+                if msgpack is None:
+                    raise HTTPException(status_code=415, detail="MessagePack support is not installed")
+                wire_type = content_type
+                # FastAPI only hands JSON content types to request.json()
+                headers = [(k, v) for k, v in scope["headers"] if k != b"content-type"]
+                scope = {**scope, "headers": headers + [(b"content-type", JSON_TYPE.encode())]}
+            token = _response_type.set(negotiate(request.headers.get("accept")))
+            try:
+                return await handler(WireRequest(scope, request.receive, wire_type))
+            finally:
+                _response_type.reset(token)
+
+        return negotiated_handler
+
+
+def ndjson_response(rows):
+    """Stream an iterable of dicts as NDJSON, so clients can consume results as they are produced."""
+    return StreamingResponse((encode(row) + b"\n" for row in rows), media_type=NDJSON_TYPE)